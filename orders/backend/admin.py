@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from .models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, Contact
+from .models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, OrderItem, \
+    Contact, ImportJob
+from .pricelist import guess_format
+from .tasks import start_imports
 
 
 @admin.register(User)
@@ -33,7 +36,16 @@ class CustomUserAdmin(UserAdmin):
 
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
-    pass
+    actions = ('load_price_list',)
+
+    @admin.action(description='Загрузить прайс по ссылке магазина')
+    def load_price_list(self, request, queryset):
+        jobs = [
+            ImportJob.objects.create(user_id=shop.user_id, shop=shop, url=shop.url, format=guess_format(shop.url))
+            for shop in queryset.exclude(url=None).exclude(user=None)
+        ]
+        start_imports(jobs)
+        self.message_user(request, f'Запущено загрузок: {len(jobs)}')
 
 
 @admin.register(Category)
@@ -73,4 +85,10 @@ class OrderItemAdmin(admin.ModelAdmin):
 
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
-    pass
\ No newline at end of file
+    pass
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'shop', 'url', 'state', 'rows', 'created_at', 'finished_at')
+    list_filter = ('state',)
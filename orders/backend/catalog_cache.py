@@ -0,0 +1,104 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework.response import Response
+from .etags import conditional_response, make_etag
+
+CATALOG_VERSION_KEY = 'catalog-version'
+# изменения, не относящиеся к одному магазину (категории): от них зависят и ответы по магазину
+COMMON_VERSION_KEY = f'{CATALOG_VERSION_KEY}-common'
+
+
+def version_key(shop_id=None):
+    if shop_id is None:
+        return CATALOG_VERSION_KEY
+    return f'{CATALOG_VERSION_KEY}-shop-{shop_id}'
+
+
+def initial_version():
+    """ Версия после очистки кэша начинается с времени, чтобы не совпасть с версией до очистки """
+    return time.time_ns() // 1000
+
+
+def get_version(key):
+    version = initial_version()
+    cache.add(key, version, None)
+    return cache.get(key, version)
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, initial_version(), None)
+
+
+def get_catalog_version(shop_id=None):
+    """ Текущая версия каталога: общая или одного магазина """
+    return get_version(version_key(shop_id))
+
+
+def bump_catalog_version(shop_id=None):
+    """ Увеличить версию каталога, ответы со старой версией больше не используются """
+    keys = [version_key(), COMMON_VERSION_KEY if shop_id is None else version_key(shop_id)]
+    for key in keys:
+        bump_version(key)
+
+
+def bump_catalog_version_on_commit(shop_id=None):
+    """ Увеличить версию после фиксации транзакции, чтобы в кэш не попали еще не сохраненные данные """
+    transaction.on_commit(lambda: bump_catalog_version(shop_id))
+
+
+class CatalogCacheMixin:
+    """
+    Кэширование ответов list и retrieve по версии каталога
+
+    Ключ строится из пути, отсортированных параметров запроса и версии каталога. Запрос действия
+    из shop_scoped_actions по одному магазину (?shop_id=) зависит от версии этого магазина и версии
+    изменений, общих для всех магазинов (категории), остальные - от общей версии, которую увеличивает
+    любое изменение каталога. Попадание в кэш не обращается
+    к БД и не вызывает сериализатор, а при совпадении If-None-Match с ETag ответ 304 возвращается без чтения кэша.
+    """
+
+    # действия, которые фильтруют выдачу по ?shop_id=; списки магазинов и категорий зависят от всех магазинов
+    shop_scoped_actions = ()
+
+    def catalog_cache_key(self, request):
+        params = sorted((key, value) for key, values in request.query_params.lists() for value in values if value)
+        shop_id = request.query_params.get('shop_id', '')
+        if shop_id.isdigit() and self.action in self.shop_scoped_actions:
+            version = f'{get_version(COMMON_VERSION_KEY)}-{get_catalog_version(int(shop_id))}'
+        else:
+            version = get_catalog_version()
+        query = '&'.join(f'{key}={value}' for key, value in params)
+        url = f'{request.accepted_renderer.format}:{request.build_absolute_uri(request.path)}?{query}'
+        digest = hashlib.md5(url.encode()).hexdigest()
+        return f'catalog-response-{version}-{digest}'
+
+    def cached_response(self, request, key, handler, *args, **kwargs):
+        """ Кэшируются данные ответа DRF или готовое тело ответа, собранное из фрагментов """
+        data = cache.get(key)
+        if isinstance(data, bytes):
+            return HttpResponse(data, content_type='application/json')
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            data = response.data if isinstance(response, Response) else response.content
+            cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+        return response
+
+    def conditional_cached_response(self, request, handler, *args, **kwargs):
+        """ ETag совпадает с ключом кэша: он меняется вместе с версией каталога и параметрами запроса """
+        key = self.catalog_cache_key(request)
+        return conditional_response(request, make_etag(key), self.cached_response, key, handler, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_cached_response(request, super().retrieve, *args, **kwargs)
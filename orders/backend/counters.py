@@ -0,0 +1,128 @@
+from django.db import connection
+from .models import CategoryCounter, ProductListing
+
+# счетчики пар категория-магазин пересчитываются по строкам витрины, перезаписываются только изменившиеся;
+# удаление и вставка затрагивают разные пары, поэтому выполняются одним запросом и возвращают измененные пары.
+# Вставляются только пары существующих категорий и магазинов: строка витрины могла пережить их удаление
+PAIRS_SQL = """
+    WITH {pairs}removed AS (
+        DELETE FROM backend_categorycounter k {using}
+        WHERE {removed} AND NOT EXISTS (
+            SELECT 1 FROM backend_productlisting l WHERE l.category_id = k.category_id AND l.shop_id = k.shop_id
+        )
+        RETURNING k.category_id, k.shop_id
+    ), changed AS (
+        INSERT INTO backend_categorycounter (category_id, shop_id, offer_count, in_stock_count, min_price)
+        SELECT l.category_id, l.shop_id, count(*), count(*) FILTER (WHERE l.quantity > 0),
+            min(l.price) FILTER (WHERE l.quantity > 0)
+        FROM backend_productlisting l {join}
+        JOIN backend_category c ON c.id = l.category_id JOIN backend_shop s ON s.id = l.shop_id
+        WHERE {changed}
+        GROUP BY l.category_id, l.shop_id
+        ON CONFLICT (category_id, shop_id) DO UPDATE SET offer_count = EXCLUDED.offer_count,
+            in_stock_count = EXCLUDED.in_stock_count, min_price = EXCLUDED.min_price
+        WHERE (backend_categorycounter.offer_count, backend_categorycounter.in_stock_count,
+            backend_categorycounter.min_price) IS DISTINCT FROM (EXCLUDED.offer_count, EXCLUDED.in_stock_count,
+            EXCLUDED.min_price)
+        RETURNING category_id, shop_id
+    )
+    SELECT category_id, shop_id FROM removed UNION SELECT category_id, shop_id FROM changed
+"""
+
+SHOP_PAIRS_SQL = PAIRS_SQL.format(
+    pairs='', using='', removed='k.shop_id = %(shop_id)s', join='', changed='l.shop_id = %(shop_id)s'
+)
+
+OFFER_PAIRS_SQL = PAIRS_SQL.format(
+    pairs='pairs AS (SELECT * FROM unnest(%(categories)s::bigint[], %(shops)s::bigint[]) AS p(category_id, shop_id)), ',
+    using='USING pairs p', removed='k.category_id = p.category_id AND k.shop_id = p.shop_id',
+    join='JOIN pairs p ON p.category_id = l.category_id AND p.shop_id = l.shop_id', changed='true'
+)
+
+ALL_PAIRS_SQL = PAIRS_SQL.format(pairs='', using='', removed='true', join='', changed='true')
+
+# счетчики магазинов и категорий собираются из счетчиков пар, категории - только по активным магазинам.
+# Категории общие для магазинов, которые загружаются параллельно: строки блокируются заранее в порядке id,
+# иначе два UPDATE могут заблокировать одни и те же категории в разном порядке и взаимно заблокироваться
+TOTALS_SQL = """
+    SELECT s.id FROM backend_shop s WHERE {shops} ORDER BY s.id FOR UPDATE;
+    SELECT c.id FROM backend_category c WHERE {categories} ORDER BY c.id FOR UPDATE;
+    UPDATE backend_shop s SET offer_count = t.offer_count, in_stock_count = t.in_stock_count,
+        min_price = t.min_price
+    FROM (
+        SELECT s.id, coalesce(sum(k.offer_count), 0) AS offer_count,
+            coalesce(sum(k.in_stock_count), 0) AS in_stock_count, min(k.min_price) AS min_price
+        FROM backend_shop s LEFT JOIN backend_categorycounter k ON k.shop_id = s.id
+        WHERE {shops}
+        GROUP BY s.id
+    ) t
+    WHERE s.id = t.id AND (s.offer_count, s.in_stock_count, s.min_price)
+        IS DISTINCT FROM (t.offer_count, t.in_stock_count, t.min_price);
+    UPDATE backend_category c SET offer_count = t.offer_count, in_stock_count = t.in_stock_count,
+        min_price = t.min_price
+    FROM (
+        SELECT c.id, coalesce(sum(k.offer_count), 0) AS offer_count,
+            coalesce(sum(k.in_stock_count), 0) AS in_stock_count, min(k.min_price) AS min_price
+        FROM backend_category c LEFT JOIN (
+            backend_categorycounter k JOIN backend_shop s ON s.id = k.shop_id AND s.state
+        ) ON k.category_id = c.id
+        WHERE {categories}
+        GROUP BY c.id
+    ) t
+    WHERE c.id = t.id AND (c.offer_count, c.in_stock_count, c.min_price)
+        IS DISTINCT FROM (t.offer_count, t.in_stock_count, t.min_price);
+"""
+
+SOME_TOTALS_SQL = TOTALS_SQL.format(shops='s.id = ANY(%(shops)s)', categories='c.id = ANY(%(categories)s)')
+
+ALL_TOTALS_SQL = TOTALS_SQL.format(shops='true', categories='true')
+
+
+def roll_up(categories, shops):
+    """ Пересчитать счетчики категорий и магазинов по их парам """
+    categories, shops = list(set(categories)), list(set(shops))
+    if not categories and not shops:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(SOME_TOTALS_SQL, {'categories': categories, 'shops': shops})
+
+
+def roll_up_pairs(pairs):
+    roll_up([category_id for category_id, _ in pairs], [shop_id for _, shop_id in pairs])
+
+
+def listing_pairs(offer_ids):
+    """ Пары категория-магазин, к которым позиции относятся в витрине """
+    return set(ProductListing.objects.filter(id__in=offer_ids).values_list('category_id', 'shop_id').distinct())
+
+
+def refresh_counters(shop_id):
+    """ Пересчитать пары магазина после загрузки прайса, итоги - только у затронутых категорий и магазина """
+    with connection.cursor() as cursor:
+        cursor.execute(SHOP_PAIRS_SQL, {'shop_id': shop_id})
+        roll_up_pairs(cursor.fetchall())
+
+
+def refresh_pair_counters(pairs):
+    """ Пересчитать отдельные пары после изменения остатков или правки позиций """
+    if not pairs:
+        return
+    categories, shops = zip(*pairs)
+    with connection.cursor() as cursor:
+        cursor.execute(OFFER_PAIRS_SQL, {'categories': list(categories), 'shops': list(shops)})
+        roll_up_pairs(cursor.fetchall())
+
+
+def shop_categories(shop_id):
+    return list(CategoryCounter.objects.filter(shop_id=shop_id).values_list('category_id', flat=True))
+
+
+def category_shops(category_id):
+    return list(CategoryCounter.objects.filter(category_id=category_id).values_list('shop_id', flat=True))
+
+
+def reconcile_counters():
+    """ Сверить все счетчики с витриной и исправить расхождения """
+    with connection.cursor() as cursor:
+        cursor.execute(ALL_PAIRS_SQL)
+        cursor.execute(ALL_TOTALS_SQL)
@@ -0,0 +1,189 @@
+import io
+import ipaddress
+import os
+import socket
+from urllib.parse import urljoin, urlsplit, urlunsplit
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from .importer import file_hash
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+MAX_SIZE = 1024 * 1024 * 1024
+# проверка прайса без загрузки скачивает его в веб-процессе, поэтому размер ограничен сильнее
+DRY_RUN_MAX_SIZE = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+
+
+class PriceListTooLarge(Exception):
+    pass
+
+
+class PriceListHostForbidden(Exception):
+    pass
+
+
+class LimitedReader(io.RawIOBase):
+    """ Чтение ответа сервера с ограничением на размер """
+
+    def __init__(self, raw, limit):
+        self.raw = raw
+        self.limit = limit
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self.raw.read(len(buffer))
+        self.size += len(chunk)
+        if self.size > self.limit:
+            raise PriceListTooLarge(f'Размер прайса превышает {self.limit} байт')
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def is_http(url):
+    return url.startswith(('http://', 'https://'))
+
+
+def check_path(path):
+    """ Локальный прайс читается только из каталогов PRICE_LIST_DIRS, иначе магазин прочитал бы любой файл сервера """
+    path = os.path.realpath(path)
+    for directory in settings.PRICE_LIST_DIRS:
+        directory = os.path.realpath(directory)
+        if os.path.commonpath([path, directory]) == directory:
+            return path
+    raise PermissionError(f'Загрузка прайса из {path} запрещена')
+
+
+def check_host(url):
+    """
+    Ссылка не должна вести во внутреннюю сеть: проверяются все адреса, в которые разрешается имя хоста
+
+    Возвращает проверенный адрес, соединение устанавливается с ним, а не с результатом повторного
+    разрешения имени, которое мог бы подменить DNS (DNS rebinding).
+    """
+    host = urlsplit(url).hostname
+    if not host:
+        raise PriceListHostForbidden(f'В ссылке не указан хост: {url}')
+    addresses = [ipaddress.ip_address(sockaddr[0].split('%')[0]) for *_, sockaddr in socket.getaddrinfo(host, None)]
+    if host not in settings.PRICE_LIST_ALLOWED_HOSTS:
+        for address in addresses:
+            if not address.is_global or address.is_multicast:
+                raise PriceListHostForbidden(f'Загрузка прайса с адреса {address} ({host}) запрещена')
+    return addresses[0]
+
+
+class PinnedAdapter(HTTPAdapter):
+    """ https соединение с адресом вместо имени: имя хоста передается в SNI и проверяется по сертификату """
+
+    def __init__(self, host):
+        self.host = host
+        super().__init__()
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.update(server_hostname=self.host, assert_hostname=self.host)
+        super().init_poolmanager(*args, **kwargs)
+
+
+def pinned_get(session, url, address, headers, **kwargs):
+    """ GET по ссылке с подключением к заданному адресу, имя хоста остается в заголовке Host """
+    parts = urlsplit(url)
+    host = f'[{address}]' if address.version == 6 else str(address)
+    netloc = host if parts.port is None else f'{host}:{parts.port}'
+    host_header = parts.hostname if parts.port is None else f'{parts.hostname}:{parts.port}'
+    if parts.scheme == 'https':
+        session.mount('https://', PinnedAdapter(parts.hostname))
+    return session.get(
+        urlunsplit(parts._replace(netloc=netloc)), headers=dict(headers, Host=host_header), **kwargs
+    )
+
+
+class PriceListSource:
+    """
+    Источник прайса: локальный файл или http(s) ссылка
+
+    Ссылка скачивается потоково с условным запросом по сохраненным в магазине ETag и Last-Modified,
+    при ответе 304 прайс не изменился и не загружается. Перенаправления выполняются вручную, чтобы адрес
+    каждого перехода проверялся так же, как исходная ссылка. Локальный файл - только из PRICE_LIST_DIRS.
+    """
+
+    def __init__(self, url, shop=None, max_size=None):
+        self.url = url
+        self.shop = shop
+        self.max_size = max_size or MAX_SIZE
+        self.stream = None
+        self.response = None
+        self.session = None
+        self.price_hash = ''
+        self.not_modified = False
+        self.etag = ''
+        self.last_modified = ''
+
+    def __enter__(self):
+        if is_http(self.url):
+            self.open_url()
+        else:
+            self.stream = open(check_path(self.url), 'rb')
+            self.price_hash = file_hash(self.stream)
+            self.stream.seek(0)
+        return self
+
+    def __exit__(self, *args):
+        if self.stream is not None:
+            self.stream.close()
+        if self.response is not None:
+            self.response.close()
+        if self.session is not None:
+            self.session.close()
+
+    def conditional_headers(self):
+        headers = {}
+        if self.shop is not None and self.shop.feed_url == self.url:
+            if self.shop.feed_etag:
+                headers['If-None-Match'] = self.shop.feed_etag
+            if self.shop.feed_last_modified:
+                headers['If-Modified-Since'] = self.shop.feed_last_modified
+        return headers
+
+    def open_url(self):
+        url = self.url
+        for _ in range(MAX_REDIRECTS + 1):
+            address = check_host(url)
+            if self.session is not None:
+                self.session.close()
+            # прокси из окружения подключался бы к имени хоста сам, минуя проверенный адрес
+            self.session = requests.Session()
+            self.session.trust_env = False
+            self.response = pinned_get(
+                self.session, url, address, self.conditional_headers(), stream=True, allow_redirects=False,
+                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+            )
+            if not self.response.is_redirect:
+                break
+            url = urljoin(url, self.response.headers['Location'])
+            self.response.close()
+        else:
+            raise requests.TooManyRedirects(f'Больше {MAX_REDIRECTS} перенаправлений: {self.url}')
+        if self.response.status_code == 304:
+            self.not_modified = True
+            return
+        self.response.raise_for_status()
+        if int(self.response.headers.get('Content-Length') or 0) > self.max_size:
+            raise PriceListTooLarge(f'Размер прайса превышает {self.max_size} байт')
+        self.response.raw.decode_content = True
+        self.stream = io.BufferedReader(LimitedReader(self.response.raw, self.max_size), CHUNK_SIZE)
+        self.etag = self.response.headers.get('ETag', '')
+        self.last_modified = self.response.headers.get('Last-Modified', '')
+
+    def save_validators(self, shop):
+        """ Запомнить ETag и Last-Modified загруженного прайса вместе со ссылкой, к которой они относятся """
+        if not is_http(self.url):
+            return
+        shop.feed_url = self.url
+        shop.feed_etag = self.etag
+        shop.feed_last_modified = self.last_modified
+        shop.save(update_fields=['feed_url', 'feed_etag', 'feed_last_modified'])
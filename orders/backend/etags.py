@@ -0,0 +1,23 @@
+import hashlib
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    """ Сильный ETag из версий и отметок времени данных, тело ответа не хэшируется """
+    return '"%s"' % hashlib.md5('-'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def etag_matches(request, etag):
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in etags or etag in etags
+
+
+def conditional_response(request, etag, handler, *args, **kwargs):
+    """ Ответить 304 Not Modified при совпадении ETag, иначе вызвать обработчик и добавить ETag к ответу """
+    if etag_matches(request, etag):
+        return Response(status=304, headers={'ETag': etag})
+    response = handler(request, *args, **kwargs)
+    if response.status_code == 200:
+        response['ETag'] = etag
+    return response
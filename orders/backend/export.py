@@ -0,0 +1,87 @@
+import csv
+import gzip
+import io
+from .models import ProductListing
+from .renderers import dumps
+from .rows import listing_parameters
+from .streaming import STREAM_CHUNK_SIZE, chunked
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_FIELDS = (
+    'id', 'model', 'product_id', 'product_name', 'category_id', 'category_name', 'shop_id', 'shop_name',
+    'shop_state', 'quantity', 'price', 'price_rrc', 'parameters'
+)
+
+EXPORT_FORMATS = ('ndjson', 'csv', 'parquet')
+
+
+class ExportError(Exception):
+    pass
+
+
+def export_rows(shop_id=None, category_id=None, chunk_size=STREAM_CHUNK_SIZE):
+    """ Позиции витрины по серверному курсору, память не зависит от размера каталога """
+    listing = ProductListing.objects.order_by('id')
+    if shop_id is not None:
+        listing = listing.filter(shop_id=shop_id)
+    if category_id is not None:
+        listing = listing.filter(category_id=category_id)
+    for row in listing.values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        row['parameters'] = listing_parameters(row['parameters'])
+        yield row
+
+
+def write_ndjson(rows, stream):
+    for row in rows:
+        stream.write(dumps(row) + b'\n')
+
+
+def write_csv(rows, stream):
+    """ CSV в UTF-8, параметры пишутся в одну колонку JSON массивом """
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        row['parameters'] = dumps(row['parameters']).decode()
+        writer.writerow(row[field] for field in EXPORT_FIELDS)
+    text.detach()
+
+
+def parquet_schema():
+    return pyarrow.schema([
+        ('id', pyarrow.int64()), ('model', pyarrow.string()), ('product_id', pyarrow.int64()),
+        ('product_name', pyarrow.string()), ('category_id', pyarrow.int64()), ('category_name', pyarrow.string()),
+        ('shop_id', pyarrow.int64()), ('shop_name', pyarrow.string()), ('shop_state', pyarrow.bool_()),
+        ('quantity', pyarrow.int64()), ('price', pyarrow.int64()), ('price_rrc', pyarrow.int64()),
+        ('parameters', pyarrow.list_(pyarrow.struct([('parameter', pyarrow.string()), ('value', pyarrow.string())]))),
+    ])
+
+
+def write_parquet(rows, path, compression, chunk_size=STREAM_CHUNK_SIZE):
+    """ Parquet пишется группами строк по пачке курсора """
+    if pyarrow is None:
+        raise ExportError('Для выгрузки в Parquet требуется пакет pyarrow')
+    schema = parquet_schema()
+    with pyarrow.parquet.ParquetWriter(path, schema, compression=compression) as writer:
+        for chunk in chunked(rows, chunk_size):
+            writer.write_table(pyarrow.Table.from_pylist(chunk, schema=schema))
+
+
+def export_catalog(path, file_format='ndjson', compress=False, shop_id=None, category_id=None):
+    """ Выгрузить каталог в файл, gzip сжимает весь файл, а для Parquet - его страницы """
+    if file_format not in EXPORT_FORMATS:
+        raise ExportError(f'Неизвестный формат выгрузки: {file_format}')
+    rows = export_rows(shop_id, category_id)
+    if file_format == 'parquet':
+        write_parquet(rows, path, 'gzip' if compress else 'snappy')
+        return
+    with (gzip.open(path, 'wb') if compress else open(path, 'wb')) as stream:
+        if file_format == 'csv':
+            write_csv(rows, stream)
+        else:
+            write_ndjson(rows, stream)
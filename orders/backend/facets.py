@@ -0,0 +1,62 @@
+import re
+from django.db import connection
+from django.db.models import Exists, OuterRef, Sum
+from .models import ParameterFacet, ProductParameter
+
+# фильтр по параметру в запросе: param_<id параметра>=значение, несколько значений через запятую
+PARAMETER_FILTER = re.compile(r'^param_(\d+)$')
+
+# старые значения магазина удаляются в том же обращении к БД
+FACETS_SQL = """
+    DELETE FROM backend_parameterfacet WHERE shop_id = %(shop_id)s;
+    INSERT INTO backend_parameterfacet (category_id, shop_id, parameter_id, value, count)
+    SELECT p.category_id, pi.shop_id, pp.parameter_id, pp.value, count(*)
+    FROM backend_productparameter pp
+    JOIN backend_productinfo pi ON pi.id = pp.product_info_id
+    JOIN backend_product p ON p.id = pi.product_id
+    WHERE pi.shop_id = %(shop_id)s
+    GROUP BY p.category_id, pi.shop_id, pp.parameter_id, pp.value
+"""
+
+
+def refresh_facets(shop_id):
+    """ Пересчитать значения фильтров магазина, остальные магазины не затрагиваются """
+    with connection.cursor() as cursor:
+        cursor.execute(FACETS_SQL, {'shop_id': shop_id})
+
+
+def parameter_filters(query_params):
+    """ Выбрать из параметров запроса фильтры вида param_<id>=значение1,значение2 """
+    filters = {}
+    for key in query_params:
+        match = PARAMETER_FILTER.match(key)
+        if match:
+            values = [value for item in query_params.getlist(key) for value in item.split(',') if value]
+            if values:
+                filters[int(match.group(1))] = values
+    return filters
+
+
+def filter_by_parameters(queryset, filters):
+    """ Значения одного параметра объединяются по ИЛИ, разные параметры - по И """
+    for parameter_id, values in filters.items():
+        queryset = queryset.filter(Exists(ProductParameter.objects.filter(
+            product_info_id=OuterRef('pk'), parameter_id=parameter_id, value__in=values
+        )))
+    return queryset
+
+
+def facet_counts(category_id, shop_id=None):
+    """ Значения фильтров категории с числом позиций по активным магазинам """
+    facets = ParameterFacet.objects.filter(category_id=category_id, shop__state=True)
+    if shop_id:
+        facets = facets.filter(shop_id=shop_id)
+    rows = facets.values('parameter_id', 'parameter__name', 'value').annotate(
+        total=Sum('count')).order_by('parameter__name', 'value')
+    result = {}
+    for row in rows:
+        facet = result.setdefault(row['parameter_id'], {
+            'id': row['parameter_id'], 'name': row['parameter__name'], 'values': []
+        })
+        facet['values'].append({'value': row['value'], 'count': row['total']})
+    return list(result.values())
@@ -0,0 +1,67 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+from .facets import filter_by_parameters, parameter_filters
+from .search import search_products
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск позиций по вектору поиска с ранжированием
+
+    search_fields представления используются только для описания параметра в схеме API.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        return search_products(queryset, request.query_params.get(self.search_param, ''))
+
+
+class ProductParameterFilter(BaseFilterBackend):
+    """ Фильтр позиций по значениям параметров: ?param_<id параметра>=значение1,значение2 """
+
+    def filter_queryset(self, request, queryset, view):
+        return filter_by_parameters(queryset, parameter_filters(request.query_params))
+
+
+class ProductPriceFilter(BaseFilterBackend):
+    """ Фильтр позиций по диапазону цены и наличию: ?price_min=&price_max=&in_stock=true """
+
+    def filter_queryset(self, request, queryset, view):
+        for param, lookup in (('price_min', 'price__gte'), ('price_max', 'price__lte')):
+            value = request.query_params.get(param)
+            if value is None:
+                continue
+            if not value.isdigit():
+                raise ValidationError({param: 'Ожидается целое неотрицательное число'})
+            queryset = queryset.filter(**{lookup: int(value)})
+        if request.query_params.get('in_stock', '').lower() in ('1', 'true', 'yes'):
+            queryset = queryset.filter(quantity__gt=0)
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': 'price_min', 'required': False, 'in': 'query', 'schema': {'type': 'integer'}},
+            {'name': 'price_max', 'required': False, 'in': 'query', 'schema': {'type': 'integer'}},
+            {'name': 'in_stock', 'required': False, 'in': 'query', 'schema': {'type': 'boolean'}},
+        ]
+
+
+class ProductOrderingFilter(BaseFilterBackend):
+    """ Сортировка позиций: ?ordering=price, -price, name или -name, без нее - по релевантности поиска или id """
+
+    ordering_param = 'ordering'
+    fields = {'price': 'price', 'name': 'product_name'}
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_param, '')
+        field = self.fields.get(ordering.lstrip('-'))
+        if field is None:
+            return queryset if queryset.ordered else queryset.order_by('id')
+        if ordering.startswith('-'):
+            return queryset.order_by(f'-{field}', '-id')
+        return queryset.order_by(field, 'id')
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.ordering_param, 'required': False, 'in': 'query',
+            'schema': {'type': 'string', 'enum': [f'{sign}{name}' for name in self.fields for sign in ('', '-')]},
+        }]
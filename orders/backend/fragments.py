@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from .catalog_cache import get_catalog_version
+from .renderers import dumps
+from .streaming import STREAM_CHUNK_SIZE, chunked, is_streaming, streaming_json_response
+
+
+def offer_fragments(rows, make_row):
+    """
+    JSON позиций из кэша фрагментов
+
+    Ключ фрагмента содержит версию каталога магазина позиции, поэтому фрагменты меняются только после загрузки
+    прайса этого магазина. Промахи собираются из строк values() функцией make_row и сохраняются одним set_many.
+    """
+    versions = {shop_id: get_catalog_version(shop_id) for shop_id in {row['shop_id'] for row in rows}}
+    keys = [f'offer-fragment-{row["id"]}-{versions[row["shop_id"]]}' for row in rows]
+    fragments = cache.get_many(keys)
+    missing = [(key, row) for key, row in zip(keys, rows) if key not in fragments]
+    if missing:
+        fresh = {key: dumps(make_row(row)) for key, row in missing}
+        cache.set_many(fresh, settings.CATALOG_CACHE_TIMEOUT)
+        fragments.update(fresh)
+    return [fragments[key] for key in keys]
+
+
+def fragment_chunks(rows, make_row, chunk_size=STREAM_CHUNK_SIZE):
+    """ Фрагменты позиций пачками по серверному курсору для потокового ответа """
+    for chunk in chunked(rows.iterator(chunk_size=chunk_size), chunk_size):
+        yield offer_fragments(chunk, make_row)
+
+
+class OfferFragmentMixin:
+    """
+    Список позиций, собранный склейкой готовых JSON фрагментов
+
+    Позиции читаются через values(fragment_fields) и превращаются в JSON функцией fragment_row без сериализатора.
+    Обертка страницы рендерится тем же кодировщиком с пустым results, в который вставляются фрагменты, так что тело
+    совпадает с обычным ответом побайтно. Для других форматов (browsable API) используется обычный list.
+    С ?stream=true отдается весь результат без постраничного вывода JSON массивом по пачкам.
+    """
+
+    fragment_fields = ()
+    fragment_row = None
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json' or 'indent' in request.accepted_media_type \
+                or self.paginator is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values(*self.fragment_fields, *queryset.query.annotations)
+        if is_streaming(request):
+            return streaming_json_response(fragment_chunks(rows, type(self).fragment_row))
+        page = self.paginate_queryset(rows)
+        fragments = offer_fragments(page, type(self).fragment_row)
+        envelope = self.get_paginated_response([]).data
+        head = dumps(envelope)
+        # results - последний ключ обертки: тело заканчивается на []}
+        body = head[:-2] + b','.join(fragments) + head[-2:]
+        return HttpResponse(body, content_type='application/json')
@@ -0,0 +1,530 @@
+import csv
+import hashlib
+import io
+import json
+import time
+import uuid
+from django.db import connection, transaction
+from .pricelist import ITEM_KEYS
+from .signals import catalog_updated, import_deletions
+from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, OrderItem
+
+BATCH_SIZE = 1000
+IMPORT_MODES = ('diff', 'replace', 'staging')
+PRODUCT_INFO_FIELDS = ('product_id', 'model', 'price', 'price_rrc', 'quantity')
+CHUNK_SIZE = 1024 * 1024
+# первый ключ advisory lock загрузок прайса, второй - id пользователя-поставщика
+IMPORT_LOCK_NAMESPACE = 1001
+
+
+def lock_import(user_id):
+    """ Заблокировать загрузку прайса поставщика до конца транзакции, параллельные загрузки ждут своей очереди """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [IMPORT_LOCK_NAMESPACE, user_id])
+
+
+def file_hash(stream):
+    """ Хэш содержимого прайса """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def item_hash(item):
+    """ Хэш позиции прайса, по нему неизменившиеся позиции пропускаются без сравнения полей """
+    content = [item['name'], item['category'], item['model'], item['price'], item['price_rrc'], item['quantity'],
+               sorted((name, str(value)) for name, value in item['parameters'].items())]
+    return hashlib.md5(json.dumps(content, ensure_ascii=False).encode()).hexdigest()
+
+
+class QueryCounter:
+    """ Счетчик запросов к БД """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class PriceListImporter:
+    """
+    Пакетная загрузка прайса поставщика
+
+    В режиме diff позиции сопоставляются с уже загруженными по (магазин, external_id):
+    новые создаются, измененные обновляются, отсутствующие в прайсе снимаются с продажи.
+    В режиме replace прайс магазина удаляется и загружается заново.
+    Режим staging выполняет StagingImporter.
+    Хэш файла сохраняется в магазине, хэши позиций - в ProductInfo.content_hash.
+    """
+
+    def __init__(self, user_id, batch_size=BATCH_SIZE, progress=None, mode='diff'):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f'Неизвестный режим загрузки: {mode}')
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.progress = progress
+        self.mode = mode
+        self.shop = None
+        self.products = {}
+        self.parameters = {}
+        self.seen = set()
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.removed = 0
+
+    def is_unchanged(self, price_hash):
+        """ Проверить, загружался ли уже этот файл, для режима replace всегда False """
+        if not price_hash:
+            return False
+        self.shop = Shop.objects.filter(user_id=self.user_id, price_hash=price_hash).first()
+        return self.mode != 'replace' and self.shop is not None
+
+    def run(self, records, price_hash=''):
+        """ Загрузить прайс из потока записей и вернуть статистику загрузки """
+        counter = QueryCounter()
+        started = time.monotonic()
+        with connection.execute_wrapper(counter), transaction.atomic():
+            lock_import(self.user_id)
+            categories = []
+            batch = []
+            for record in records:
+                if record.kind == 'shop':
+                    self.load_shop(record.value)
+                elif record.kind == 'category':
+                    categories.append(record.value)
+                else:
+                    batch.append(record.value)
+                    if len(batch) >= self.batch_size:
+                        self.flush(categories, batch)
+                        categories, batch = [], []
+            self.flush(categories, batch)
+            if self.mode == 'diff' and self.shop is not None:
+                self.retire_missing()
+            self.save_price_hash(price_hash)
+            if self.shop is not None:
+                catalog_updated.send(sender=self.__class__, shop_id=self.shop.id)
+        return self.statistics(counter, started)
+
+    def save_price_hash(self, price_hash):
+        if self.shop is not None and self.shop.price_hash != price_hash:
+            self.shop.price_hash = price_hash
+            self.shop.save(update_fields=['price_hash'])
+
+    def statistics(self, counter, started):
+        seconds = time.monotonic() - started
+        return {
+            'mode': self.mode,
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'removed': self.removed,
+            'queries': counter.count,
+            'seconds': round(seconds, 3),
+            'rows_per_sec': int(self.rows / seconds) if seconds else self.rows
+        }
+
+    def load_shop(self, name):
+        """ Найти магазин поставщика, в режиме replace очистить его прайс """
+        self.shop, _ = Shop.objects.get_or_create(name=name, user_id=self.user_id)
+        if self.mode == 'replace':
+            with import_deletions():
+                self.removed += ProductInfo.objects.filter(shop_id=self.shop.id).delete()[1].get(
+                    ProductInfo._meta.label, 0)
+
+    def flush(self, categories, batch):
+        """ Записать накопленные категории и товары """
+        if not categories and not batch:
+            return
+        if self.shop is None:
+            raise ValueError('В прайсе не указан магазин')
+        if categories:
+            self.load_categories(categories)
+        if batch:
+            self.load_goods(batch)
+            if self.progress:
+                self.progress(self.rows)
+
+    def load_categories(self, categories):
+        """ Создать недостающие категории и привязать их к магазину """
+        names = {category['id']: category['name'] for category in categories}
+        existing = set(Category.objects.filter(id__in=names).values_list('id', flat=True))
+        Category.objects.bulk_create(
+            [Category(id=category_id, name=name) for category_id, name in names.items() if category_id not in existing],
+            ignore_conflicts=True
+        )
+        through = Category.shops.through
+        through.objects.bulk_create(
+            [through(category_id=category_id, shop_id=self.shop.id) for category_id in names], ignore_conflicts=True
+        )
+
+    def resolve_products(self, keys):
+        """ Найти id продуктов по паре (название, категория), недостающие создать """
+        names = {name for name, _ in keys}
+        category_ids = {category_id for _, category_id in keys}
+        found = Product.objects.filter(name__in=names, category_id__in=category_ids).values_list(
+            'id', 'name', 'category_id')
+        for product_id, name, category_id in found:
+            self.products.setdefault((name, category_id), product_id)
+        missing = [Product(name=name, category_id=category_id) for name, category_id in keys
+                   if (name, category_id) not in self.products]
+        for product in Product.objects.bulk_create(missing, batch_size=self.batch_size):
+            self.products[(product.name, product.category_id)] = product.id
+
+    def resolve_parameters(self, names):
+        """ Найти id параметров по названию, недостающие создать """
+        for parameter_id, name in Parameter.objects.filter(name__in=names).values_list('id', 'name'):
+            self.parameters.setdefault(name, parameter_id)
+        missing = [Parameter(name=name) for name in names if name not in self.parameters]
+        for parameter in Parameter.objects.bulk_create(missing, batch_size=self.batch_size):
+            self.parameters[parameter.name] = parameter.id
+
+    def existing_goods(self, external_ids):
+        """ Текущие позиции магазина по external_id """
+        return {
+            row['external_id']: row for row in ProductInfo.objects.filter(
+                shop_id=self.shop.id, external_id__in=external_ids).values(
+                'id', 'external_id', 'content_hash', *PRODUCT_INFO_FIELDS)
+        }
+
+    def existing_parameters(self, product_info_ids):
+        """ Текущие параметры позиций """
+        parameters = {product_info_id: {} for product_info_id in product_info_ids}
+        for product_info_id, parameter_id, value in ProductParameter.objects.filter(
+                product_info_id__in=product_info_ids).values_list('product_info_id', 'parameter_id', 'value'):
+            parameters[product_info_id][parameter_id] = value
+        return parameters
+
+    def load_goods(self, batch):
+        """ Записать пачку товаров """
+        product_keys = {(item['name'], item['category']) for item in batch} - self.products.keys()
+        if product_keys:
+            self.resolve_products(product_keys)
+        parameter_names = {name for item in batch for name in item['parameters']} - self.parameters.keys()
+        if parameter_names:
+            self.resolve_parameters(parameter_names)
+        goods = {item['id']: item for item in batch}
+        existing = self.existing_goods(goods) if self.mode == 'diff' else {}
+        created, mismatched = [], []
+        for external_id, item in goods.items():
+            values = {
+                'product_id': self.products[(item['name'], item['category'])],
+                'model': item['model'],
+                'price': item['price'],
+                'price_rrc': item['price_rrc'],
+                'quantity': item['quantity'],
+                'content_hash': item_hash(item),
+            }
+            item_parameters = {self.parameters[name]: str(value) for name, value in item['parameters'].items()}
+            current = existing.get(external_id)
+            if current is None:
+                created.append((ProductInfo(shop_id=self.shop.id, external_id=external_id, **values), item_parameters))
+            elif current['content_hash'] == values['content_hash']:
+                self.seen.add(current['id'])
+                self.unchanged += 1
+            else:
+                self.seen.add(current['id'])
+                mismatched.append((current, values, item_parameters))
+        self.insert_goods(created)
+        self.update_goods(mismatched)
+        self.rows += len(batch)
+
+    def insert_goods(self, created):
+        """ Создать новые позиции и их параметры """
+        if not created:
+            return
+        product_infos = ProductInfo.objects.bulk_create([product_info for product_info, _ in created])
+        self.seen.update(product_info.id for product_info in product_infos)
+        self.create_parameters({
+            product_info.id: item_parameters for product_info, (_, item_parameters) in zip(product_infos, created)
+        })
+        self.inserted += len(created)
+
+    def update_goods(self, mismatched):
+        """ Сравнить позиции с несовпавшим хэшем, обновить измененные и заменить их параметры """
+        if not mismatched:
+            return
+        current_parameters = self.existing_parameters([current['id'] for current, _, _ in mismatched])
+        parameters = {}
+        for current, values, item_parameters in mismatched:
+            if current_parameters[current['id']] != item_parameters:
+                parameters[current['id']] = item_parameters
+            elif all(current[field] == values[field] for field in PRODUCT_INFO_FIELDS):
+                self.unchanged += 1
+                continue
+            self.updated += 1
+        ProductInfo.objects.bulk_update(
+            [ProductInfo(id=current['id'], search_vector=None, **values) for current, values, _ in mismatched],
+            PRODUCT_INFO_FIELDS + ('content_hash', 'search_vector'), batch_size=self.batch_size
+        )
+        if parameters:
+            ProductParameter.objects.filter(product_info_id__in=parameters).delete()
+            self.create_parameters(parameters)
+
+    def create_parameters(self, parameters):
+        ProductParameter.objects.bulk_create([
+            ProductParameter(product_info_id=product_info_id, parameter_id=parameter_id, value=value)
+            for product_info_id, item_parameters in parameters.items()
+            for parameter_id, value in item_parameters.items()
+        ], batch_size=self.batch_size)
+
+    def retire_missing(self):
+        """ Снять с продажи позиции, которых нет в прайсе: заказанные обнулить, остальные удалить """
+        current = ProductInfo.objects.filter(shop_id=self.shop.id).values_list('id', flat=True)
+        missing = list(set(current) - self.seen)
+        for start in range(0, len(missing), self.batch_size):
+            ids = missing[start:start + self.batch_size]
+            ordered = OrderItem.objects.filter(product_info_id__in=ids).values('product_info_id')
+            self.removed += ProductInfo.objects.filter(id__in=ids, quantity__gt=0).filter(
+                id__in=ordered).update(quantity=0, content_hash='')
+            with import_deletions():
+                self.removed += ProductInfo.objects.filter(id__in=ids).exclude(id__in=ordered).delete()[1].get(
+                    ProductInfo._meta.label, 0)
+
+
+def update_stock(shop, items, batch_size=BATCH_SIZE):
+    """
+    Обновить цены и остатки позиций магазина по external_id
+
+    Каждая пачка применяется одним UPDATE, не указанные price или quantity не меняются.
+    Возвращает список external_id, которые были обновлены.
+    """
+    updated, offer_ids = [], []
+    with transaction.atomic(), connection.cursor() as cursor:
+        lock_import(shop.user_id)
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            # позиции находятся по индексу product_info_shop_external, external_id того же типа integer
+            cursor.execute("""
+                UPDATE backend_productinfo pi
+                SET price = coalesce(d.price, pi.price), quantity = coalesce(d.quantity, pi.quantity),
+                    content_hash = ''
+                FROM unnest(%s::integer[], %s::integer[], %s::integer[]) AS d(external_id, price, quantity)
+                WHERE pi.shop_id = %s AND pi.external_id = d.external_id
+                RETURNING pi.id, pi.external_id
+            """, [
+                [item['external_id'] for item in batch],
+                [item.get('price') for item in batch],
+                [item.get('quantity') for item in batch],
+                shop.id
+            ])
+            for offer_id, external_id in cursor.fetchall():
+                offer_ids.append(offer_id)
+                updated.append(external_id)
+        # прайс больше не совпадает с последним загруженным файлом
+        Shop.objects.filter(id=shop.id).update(price_hash='', feed_etag='', feed_last_modified='')
+        catalog_updated.send(sender=update_stock, shop_id=shop.id, offer_ids=offer_ids)
+    return updated
+
+
+class CopyReader(io.RawIOBase):
+    """ Файлоподобный поток строк CSV для COPY FROM STDIN """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self.buffer) < len(buffer):
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        chunk, self.buffer = self.buffer[:len(buffer)], self.buffer[len(buffer):]
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+class StagingImporter(PriceListImporter):
+    """
+    Загрузка прайса через промежуточную таблицу (только PostgreSQL)
+
+    Позиции потоково копируются командой COPY в нежурналируемую таблицу и проверяются там,
+    затем каталог магазина обновляется несколькими SQL запросами в одной короткой транзакции.
+    До ее завершения покупатели видят прежний каталог.
+    """
+
+    STAGING_COLUMNS = ('line', 'external_id', 'category_id', 'name', 'model', 'price', 'price_rrc', 'quantity',
+                       'parameters', 'content_hash')
+
+    def __init__(self, user_id, batch_size=BATCH_SIZE, progress=None, mode='staging'):
+        super().__init__(user_id, batch_size, progress, mode)
+        self.shop_name = None
+        self.categories = []
+        self.table = f'backend_import_staging_{uuid.uuid4().hex}'
+
+    def run(self, records, price_hash=''):
+        """ Загрузить прайс через промежуточную таблицу и вернуть статистику загрузки """
+        if connection.vendor != 'postgresql':
+            raise ValueError('Загрузка через промежуточную таблицу доступна только для PostgreSQL')
+        counter = QueryCounter()
+        started = time.monotonic()
+        with connection.execute_wrapper(counter), connection.cursor() as cursor:
+            try:
+                self.copy_to_staging(cursor, records)
+                self.validate_staging(cursor)
+                with transaction.atomic():
+                    lock_import(self.user_id)
+                    self.shop, _ = Shop.objects.get_or_create(name=self.shop_name, user_id=self.user_id)
+                    if self.categories:
+                        self.load_categories(self.categories)
+                    self.merge_staging(cursor)
+                    self.save_price_hash(price_hash)
+                    catalog_updated.send(sender=self.__class__, shop_id=self.shop.id)
+            finally:
+                cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+        return self.statistics(counter, started)
+
+    def staging_lines(self, records):
+        """ Строки CSV для COPY, по пути запоминаются магазин и категории """
+        output = io.StringIO()
+        writer = csv.writer(output)
+        for record in records:
+            if record.kind == 'shop':
+                self.shop_name = record.value
+                continue
+            if record.kind == 'category':
+                self.categories.append(record.value)
+                continue
+            item = record.value
+            parameters = {name: str(value) for name, value in item.get('parameters', {}).items()}
+            writer.writerow([
+                record.line, item.get('id'), item.get('category'), item.get('name'), item.get('model'),
+                item.get('price'), item.get('price_rrc'), item.get('quantity'),
+                json.dumps(parameters, ensure_ascii=False), item_hash(item) if set(ITEM_KEYS) <= item.keys() else ''
+            ])
+            self.rows += 1
+            if self.progress and self.rows % self.batch_size == 0:
+                self.progress(self.rows)
+            yield output.getvalue().encode()
+            output.seek(0)
+            output.truncate()
+
+    def copy_to_staging(self, cursor, records):
+        cursor.execute(f"""
+            CREATE UNLOGGED TABLE {self.table} (
+                line integer, external_id bigint, category_id bigint, name text, model text, price bigint,
+                price_rrc bigint, quantity bigint, parameters jsonb, content_hash text, product_id bigint, state text
+            )
+        """)
+        cursor.copy_expert(
+            f'COPY {self.table} ({", ".join(self.STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)',
+            CopyReader(self.staging_lines(records))
+        )
+
+    def validate_staging(self, cursor):
+        """ Проверить загруженные позиции, при ошибках каталог не изменяется """
+        if self.shop_name is None:
+            raise ValueError('В прайсе не указан магазин')
+        errors = []
+        cursor.execute(f"""
+            SELECT line FROM {self.table}
+            WHERE external_id IS NULL OR category_id IS NULL OR name IS NULL OR price IS NULL
+                OR price_rrc IS NULL OR quantity IS NULL OR content_hash = ''
+            ORDER BY line LIMIT 10
+        """)
+        errors += [f'Строка {line}: не заполнены обязательные поля' for line, in cursor.fetchall()]
+        cursor.execute(f"""
+            SELECT external_id, min(line) FROM {self.table} GROUP BY external_id HAVING count(*) > 1
+            ORDER BY 2 LIMIT 10
+        """)
+        errors += [f'Строка {line}: повторяется id {external_id}' for external_id, line in cursor.fetchall()]
+        cursor.execute(f"""
+            SELECT category_id, min(line) FROM {self.table} s
+            WHERE NOT (category_id = ANY(%s))
+                AND NOT EXISTS (SELECT 1 FROM backend_category c WHERE c.id = s.category_id)
+            GROUP BY category_id ORDER BY 2 LIMIT 10
+        """, [[category['id'] for category in self.categories]])
+        errors += [f'Строка {line}: неизвестная категория {category_id}' for category_id, line in cursor.fetchall()]
+        if errors:
+            raise ValueError('; '.join(errors))
+
+    def merge_staging(self, cursor):
+        """ Перенести позиции из промежуточной таблицы в каталог магазина """
+        table, shop_id = self.table, self.shop.id
+        cursor.execute(f"""
+            INSERT INTO backend_product (name, category_id)
+            SELECT DISTINCT s.name, s.category_id FROM {table} s
+            WHERE NOT EXISTS (SELECT 1 FROM backend_product p WHERE p.name = s.name AND p.category_id = s.category_id)
+        """)
+        cursor.execute(f"""
+            UPDATE {table} s SET product_id = p.id
+            FROM (SELECT name, category_id, min(id) AS id FROM backend_product GROUP BY name, category_id) p
+            WHERE p.name = s.name AND p.category_id = s.category_id
+        """)
+        cursor.execute(f"""
+            INSERT INTO backend_parameter (name)
+            SELECT DISTINCT key FROM {table} s, jsonb_object_keys(s.parameters) key
+            WHERE NOT EXISTS (SELECT 1 FROM backend_parameter p WHERE p.name = key)
+        """)
+        cursor.execute(f"""
+            UPDATE {table} s SET state = CASE WHEN pi.content_hash = s.content_hash THEN 'unchanged' ELSE 'changed' END
+            FROM backend_productinfo pi WHERE pi.shop_id = %s AND pi.external_id = s.external_id
+        """, [shop_id])
+        cursor.execute(f"UPDATE {table} SET state = 'new' WHERE state IS NULL")
+        cursor.execute(f"SELECT state, count(*) FROM {table} GROUP BY state")
+        counts = dict(cursor.fetchall())
+        self.inserted = counts.get('new', 0)
+        self.updated = counts.get('changed', 0)
+        self.unchanged = counts.get('unchanged', 0)
+        cursor.execute(f"""
+            UPDATE backend_productinfo pi SET product_id = s.product_id, model = coalesce(s.model, ''),
+                price = s.price, price_rrc = s.price_rrc, quantity = s.quantity, content_hash = s.content_hash,
+                search_vector = NULL
+            FROM {table} s WHERE pi.shop_id = %s AND pi.external_id = s.external_id AND s.state = 'changed'
+        """, [shop_id])
+        cursor.execute(f"""
+            INSERT INTO backend_productinfo (product_id, shop_id, external_id, model, price, price_rrc, quantity,
+                content_hash)
+            SELECT product_id, %s, external_id, coalesce(model, ''), price, price_rrc, quantity, content_hash
+            FROM {table} WHERE state = 'new'
+        """, [shop_id])
+        cursor.execute(f"""
+            DELETE FROM backend_productparameter pp USING backend_productinfo pi, {table} s
+            WHERE pp.product_info_id = pi.id AND pi.shop_id = %s AND pi.external_id = s.external_id
+                AND s.state = 'changed'
+        """, [shop_id])
+        cursor.execute(f"""
+            INSERT INTO backend_productparameter (product_info_id, parameter_id, value)
+            SELECT pi.id, p.id, kv.value
+            FROM {table} s
+            JOIN backend_productinfo pi ON pi.shop_id = %s AND pi.external_id = s.external_id
+            CROSS JOIN jsonb_each_text(s.parameters) kv
+            JOIN (SELECT name, min(id) AS id FROM backend_parameter GROUP BY name) p ON p.name = kv.key
+            WHERE s.state IN ('new', 'changed')
+        """, [shop_id])
+        cursor.execute(f"""
+            UPDATE backend_productinfo pi SET quantity = 0, content_hash = ''
+            WHERE pi.shop_id = %s AND pi.quantity > 0
+                AND NOT EXISTS (SELECT 1 FROM {table} s WHERE s.external_id = pi.external_id)
+                AND EXISTS (SELECT 1 FROM backend_orderitem oi WHERE oi.product_info_id = pi.id)
+        """, [shop_id])
+        self.removed = cursor.rowcount
+        cursor.execute(f"""
+            CREATE TEMP TABLE {table}_missing ON COMMIT DROP AS
+            SELECT pi.id FROM backend_productinfo pi
+            WHERE pi.shop_id = %s
+                AND NOT EXISTS (SELECT 1 FROM {table} s WHERE s.external_id = pi.external_id)
+                AND NOT EXISTS (SELECT 1 FROM backend_orderitem oi WHERE oi.product_info_id = pi.id)
+        """, [shop_id])
+        cursor.execute(f"""
+            DELETE FROM backend_productparameter WHERE product_info_id IN (SELECT id FROM {table}_missing)
+        """)
+        cursor.execute(f"DELETE FROM backend_productinfo WHERE id IN (SELECT id FROM {table}_missing)")
+        self.removed += cursor.rowcount
+
+
+def make_importer(user_id, mode='diff', **kwargs):
+    """ Загрузчик прайса для режима загрузки """
+    importer_class = StagingImporter if mode == 'staging' else PriceListImporter
+    return importer_class(user_id, mode=mode, **kwargs)
@@ -0,0 +1,81 @@
+from django.db import connection
+from .models import ProductListing
+
+LISTING_COLUMNS = (
+    'id', 'product_id', 'product_name', 'category_id', 'category_name', 'shop_id', 'shop_name', 'shop_state',
+    'model', 'quantity', 'price', 'price_rrc', 'parameters', 'search_vector'
+)
+
+LISTING_SELECT = """
+    SELECT pi.id, p.id, p.name, c.id, c.name, s.id, s.name, s.state,
+        pi.model, pi.quantity, pi.price, pi.price_rrc,
+        coalesce((
+            SELECT jsonb_agg(jsonb_build_object('parameter', pr.name, 'value', pp.value) ORDER BY pp.id)
+            FROM backend_productparameter pp JOIN backend_parameter pr ON pr.id = pp.parameter_id
+            WHERE pp.product_info_id = pi.id
+        ), '[]'::jsonb),
+        pi.search_vector
+    FROM backend_productinfo pi
+    JOIN backend_product p ON p.id = pi.product_id
+    JOIN backend_category c ON c.id = p.category_id
+    JOIN backend_shop s ON s.id = pi.shop_id
+"""
+
+# перезаписываются только изменившиеся строки
+LISTING_UPSERT = f"""
+    INSERT INTO backend_productlisting ({', '.join(LISTING_COLUMNS)})
+    {LISTING_SELECT} WHERE {{condition}}
+    ON CONFLICT (id) DO UPDATE SET {', '.join(f'{column} = EXCLUDED.{column}' for column in LISTING_COLUMNS[1:])}
+    WHERE (backend_productlisting.*) IS DISTINCT FROM (EXCLUDED.*)
+"""
+
+LISTING_SQL = """
+    DELETE FROM backend_productlisting l WHERE l.shop_id = %(shop_id)s AND NOT EXISTS (
+        SELECT 1 FROM backend_productinfo pi WHERE pi.id = l.id AND pi.shop_id = %(shop_id)s
+    );
+""" + LISTING_UPSERT.format(condition='pi.shop_id = %(shop_id)s')
+
+LISTING_OFFERS_SQL = """
+    DELETE FROM backend_productlisting l WHERE l.id = ANY(%(ids)s) AND NOT EXISTS (
+        SELECT 1 FROM backend_productinfo pi WHERE pi.id = l.id
+    );
+""" + LISTING_UPSERT.format(condition='pi.id = ANY(%(ids)s)')
+
+DELETE_LISTING_SQL = 'DELETE FROM backend_productlisting WHERE {column} = ANY(%s) RETURNING category_id, shop_id'
+
+
+def refresh_listing(shop_id):
+    """ Обновить строки витрины магазина по его позициям, выбывшие позиции удаляются """
+    with connection.cursor() as cursor:
+        cursor.execute(LISTING_SQL, {'shop_id': shop_id})
+
+
+def refresh_listing_offers(ids):
+    """ Обновить строки витрины отдельных позиций после правки вне загрузки прайса """
+    with connection.cursor() as cursor:
+        cursor.execute(LISTING_OFFERS_SQL, {'ids': list(ids)})
+
+
+def update_listing_shop(shop):
+    """ Перенести в витрину название и статус магазина """
+    ProductListing.objects.filter(shop_id=shop.id).exclude(shop_name=shop.name, shop_state=shop.state).update(
+        shop_name=shop.name, shop_state=shop.state
+    )
+
+
+def delete_listing_shop(shop):
+    ProductListing.objects.filter(shop_id=shop.id).delete()
+
+
+def delete_listing(column, values):
+    """ Удалить строки витрины по id позиций, товаров или категорий, возвращает их пары категория-магазин """
+    with connection.cursor() as cursor:
+        cursor.execute(DELETE_LISTING_SQL.format(column=column), [list(values)])
+        return set(cursor.fetchall())
+
+
+def update_listing_category(category):
+    """ Перенести в витрину название категории, возвращает число измененных строк """
+    return ProductListing.objects.filter(category_id=category.id).exclude(category_name=category.name).update(
+        category_name=category.name
+    )
@@ -0,0 +1,55 @@
+import io
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from backend.renderers import FastJSONParser, FastJSONRenderer
+
+
+class Command(BaseCommand):
+    help = 'Сравнить скорость JSONRenderer/JSONParser DRF и рендерера на orjson на больших списках товаров и заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Число позиций и заказов')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        now = timezone.now()
+        products = {'next': None, 'results': [
+            {'id': index, 'model': f'apple/iphone/{index}', 'product': {'id': index, 'name': f'Смартфон {index}'},
+             'shop': 1, 'quantity': index % 10, 'price': 60000 + index, 'price_rrc': 65000 + index,
+             'product_parameters': [
+                 {'parameter': 'Цвет', 'value': 'черный'}, {'parameter': 'Диагональ (дюйм)', 'value': '6.1'}
+             ]}
+            for index in range(rows)
+        ]}
+        orders = [
+            {'id': index, 'ordered_items': [{'id': index * 3 + item, 'product_info': item, 'quantity': 1}
+                                            for item in range(3)],
+             'state': 'new', 'dt': now}
+            for index in range(rows)
+        ]
+        for name, data in (('товары', products), ('заказы', orders)):
+            expected = JSONRenderer().render(data)
+            self.compare(
+                f'{name}, рендер', lambda: JSONRenderer().render(data), lambda: FastJSONRenderer().render(data)
+            )
+            self.compare(
+                f'{name}, разбор', lambda: JSONParser().parse(io.BytesIO(expected)),
+                lambda: FastJSONParser().parse(io.BytesIO(expected))
+            )
+            if FastJSONRenderer().render(data) != expected:
+                raise AssertionError(f'{name}: ответы не совпадают')
+
+    def compare(self, name, slow, fast):
+        started = time.perf_counter()
+        slow()
+        slow_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        fast()
+        fast_seconds = time.perf_counter() - started
+        self.stdout.write(
+            f'{name}: DRF {slow_seconds:.3f} с, orjson {fast_seconds:.3f} с, '
+            f'ускорение x{slow_seconds / max(fast_seconds, 1e-9):.1f}'
+        )
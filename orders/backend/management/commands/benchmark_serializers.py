@@ -0,0 +1,66 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from backend.models import Order, OrderItem, Parameter, Product, ProductInfo, ProductParameter
+from backend.rows import build_order_rows, listing_row
+from backend.serializers import OrderSerializer, ProductInfoSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнить скорость сериализаторов DRF и быстрой сборки ответа из строк values() на данных в памяти'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Число позиций и заказов')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        names = [Parameter(id=index, name=f'Параметр {index}') for index in range(4)]
+        offers, listing = [], []
+        for index in range(rows):
+            offer = ProductInfo(
+                id=index, model=f'model-{index}', product=Product(id=index, name=f'Товар {index}'), shop_id=1,
+                quantity=index % 10, price=100 + index, price_rrc=120 + index
+            )
+            parameters = [ProductParameter(parameter=name, value=str(index)) for name in names]
+            offer._prefetched_objects_cache = {'product_parameters': parameters}
+            offers.append(offer)
+            listing.append({
+                'id': index, 'model': offer.model, 'product_id': index, 'product_name': offer.product.name,
+                'shop_id': 1, 'quantity': offer.quantity, 'price': offer.price, 'price_rrc': offer.price_rrc,
+                'parameters': [{'parameter': name.name, 'value': str(index)} for name in names],
+            })
+        self.compare(
+            'ProductInfoSerializer', lambda: ProductInfoSerializer(offers, many=True).data,
+            lambda: [listing_row(row) for row in listing]
+        )
+
+        now = timezone.now()
+        orders, order_values, item_values = [], [], []
+        for index in range(rows):
+            order = Order(id=index, state='new', dt=now)
+            items = [OrderItem(id=index * 3 + item, order_id=index, product_info_id=item, quantity=1)
+                     for item in range(3)]
+            order._prefetched_objects_cache = {'ordered_items': items}
+            orders.append(order)
+            order_values.append((index, 'new', now))
+            item_values += [(index, item.id, item.product_info_id, item.quantity) for item in items]
+        self.compare(
+            'OrderSerializer', lambda: OrderSerializer(orders, many=True).data,
+            lambda: build_order_rows(order_values, item_values)
+        )
+
+    def compare(self, name, slow, fast):
+        renderer = JSONRenderer()
+        started = time.perf_counter()
+        expected = renderer.render(slow())
+        slow_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        result = renderer.render(fast())
+        fast_seconds = time.perf_counter() - started
+        if result != expected:
+            raise AssertionError(f'{name}: ответы не совпадают')
+        self.stdout.write(
+            f'{name}: {slow_seconds:.3f} с, быстрая сборка: {fast_seconds:.3f} с, '
+            f'ускорение x{slow_seconds / max(fast_seconds, 1e-9):.1f}'
+        )
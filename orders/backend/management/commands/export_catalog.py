@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from backend.export import EXPORT_FORMATS, ExportError, export_catalog
+
+
+class Command(BaseCommand):
+    help = 'Выгрузить позиции каталога с товаром, категорией, магазином и параметрами в NDJSON, CSV или Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Путь к файлу выгрузки')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson', help='Формат файла')
+        parser.add_argument('--gzip', action='store_true', help='Сжать выгрузку gzip')
+        parser.add_argument('--shop', type=int, help='Только позиции магазина')
+        parser.add_argument('--category', type=int, help='Только позиции категории')
+
+    def handle(self, *args, **options):
+        try:
+            export_catalog(
+                options['output'], options['format'], options['gzip'], options['shop'], options['category']
+            )
+        except ExportError as error:
+            raise CommandError(error)
+        self.stdout.write(f'Каталог выгружен в {options["output"]}')
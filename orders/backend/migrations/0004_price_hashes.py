@@ -0,0 +1,23 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_import_job_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=32, verbose_name='Хэш позиции прайса'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='price_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хэш последнего прайса'),
+        ),
+    ]
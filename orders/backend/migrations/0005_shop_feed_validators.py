@@ -0,0 +1,23 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_price_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='feed_etag',
+            field=models.CharField(blank=True, max_length=200, verbose_name='ETag прайса по ссылке'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='feed_last_modified',
+            field=models.CharField(blank=True, max_length=50, verbose_name='Last-Modified прайса по ссылке'),
+        ),
+    ]
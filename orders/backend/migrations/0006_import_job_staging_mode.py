@@ -0,0 +1,18 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_shop_feed_validators'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='mode',
+            field=models.CharField(choices=[('diff', 'Обновление изменившихся позиций'), ('replace', 'Полная перезагрузка'), ('staging', 'Через промежуточную таблицу')], default='diff', max_length=10, verbose_name='Режим загрузки'),
+        ),
+    ]
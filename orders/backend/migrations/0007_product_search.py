@@ -0,0 +1,44 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:19
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_import_job_staging_mode'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='productinfo',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True, verbose_name='Вектор поиска'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_info_search'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE backend_productinfo pi SET search_vector =
+                setweight(to_tsvector('russian', coalesce(p.name, '')), 'A') ||
+                setweight(to_tsvector('russian', coalesce(pi.model, '')), 'B') ||
+                setweight(to_tsvector('russian', coalesce(c.name, '')), 'C') ||
+                setweight(to_tsvector('russian', coalesce((
+                    SELECT string_agg(pp.value, ' ') FROM backend_productparameter pp WHERE pp.product_info_id = pi.id
+                ), '')), 'D')
+            FROM backend_product p JOIN backend_category c ON c.id = p.category_id
+            WHERE p.id = pi.product_id
+            """,
+            migrations.RunSQL.noop
+        ),
+    ]
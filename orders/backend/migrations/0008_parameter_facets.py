@@ -0,0 +1,60 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=80, verbose_name='Значение')),
+                ('count', models.PositiveIntegerField(verbose_name='Количество позиций')),
+            ],
+            options={
+                'verbose_name': 'Значение фильтра',
+                'verbose_name_plural': 'Значения фильтров',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value'], name='product_parameter_value'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.category', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='parameter',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.parameter', verbose_name='Параметр'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.shop', verbose_name='Магазин'),
+        ),
+        migrations.AddConstraint(
+            model_name='parameterfacet',
+            constraint=models.UniqueConstraint(fields=('category', 'shop', 'parameter', 'value'), name='unique_parameter_facet'),
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO backend_parameterfacet (category_id, shop_id, parameter_id, value, count)
+            SELECT p.category_id, pi.shop_id, pp.parameter_id, pp.value, count(*)
+            FROM backend_productparameter pp
+            JOIN backend_productinfo pi ON pi.id = pp.product_info_id
+            JOIN backend_product p ON p.id = pi.product_id
+            GROUP BY p.category_id, pi.shop_id, pp.parameter_id, pp.value
+            """,
+            migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:31
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='Id информации о продукте')),
+                ('product_id', models.BigIntegerField(verbose_name='Id продукта')),
+                ('product_name', models.CharField(max_length=80, verbose_name='Название продукта')),
+                ('category_id', models.BigIntegerField(verbose_name='Id категории')),
+                ('category_name', models.CharField(max_length=50, verbose_name='Категория')),
+                ('shop_id', models.BigIntegerField(verbose_name='Id магазина')),
+                ('shop_name', models.CharField(max_length=50, verbose_name='Магазин')),
+                ('shop_state', models.BooleanField(verbose_name='Статус получения заказов')),
+                ('model', models.CharField(blank=True, max_length=80, verbose_name='Модель')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('price', models.PositiveIntegerField(verbose_name='Цена')),
+                ('price_rrc', models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')),
+                ('parameters', models.JSONField(default=list, verbose_name='Параметры')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True, verbose_name='Вектор поиска')),
+            ],
+            options={
+                'verbose_name': 'Позиция витрины',
+                'verbose_name_plural': 'Витрина',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_category_name',
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='product_info_search',
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='product_info_price',
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='product_info_shop_price',
+        ),
+        migrations.RemoveIndex(
+            model_name='productinfo',
+            name='product_info_in_stock_price',
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='listing_search'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['price', 'id'], name='listing_price'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['category_id', 'price', 'id'], name='listing_category_price'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['category_id', 'product_name', 'id'], name='listing_category_name'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(fields=['shop_id', 'price', 'id'], name='listing_shop_price'),
+        ),
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['category_id', 'price', 'id'], name='listing_category_in_stock'),
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO backend_productlisting (
+                id, product_id, product_name, category_id, category_name, shop_id, shop_name, shop_state,
+                model, quantity, price, price_rrc, parameters, search_vector
+            )
+            SELECT pi.id, p.id, p.name, c.id, c.name, s.id, s.name, s.state,
+                pi.model, pi.quantity, pi.price, pi.price_rrc,
+                coalesce((
+                    SELECT jsonb_agg(jsonb_build_object('parameter', pr.name, 'value', pp.value) ORDER BY pp.id)
+                    FROM backend_productparameter pp JOIN backend_parameter pr ON pr.id = pp.parameter_id
+                    WHERE pp.product_info_id = pi.id
+                ), '[]'::jsonb),
+                pi.search_vector
+            FROM backend_productinfo pi
+            JOIN backend_product p ON p.id = pi.product_id
+            JOIN backend_category c ON c.id = p.category_id
+            JOIN backend_shop s ON s.id = pi.shop_id
+            """,
+            migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_product_listing'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productlisting',
+            index=models.Index(condition=models.Q(('quantity__gt', 0), ('shop_state', True)), fields=['product_id', 'price', 'id'], name='listing_product_offers'),
+        ),
+    ]
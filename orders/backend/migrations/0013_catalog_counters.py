@@ -0,0 +1,90 @@
+# Generated by Django 4.0.10 on 2026-10-18 17:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_product_offers_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='in_stock_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Позиций в наличии'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='min_price',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Минимальная цена в наличии'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='offer_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество позиций'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='in_stock_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Позиций в наличии'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='min_price',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Минимальная цена в наличии'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='offer_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество позиций'),
+        ),
+        migrations.CreateModel(
+            name='CategoryCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offer_count', models.PositiveIntegerField(verbose_name='Количество позиций')),
+                ('in_stock_count', models.PositiveIntegerField(verbose_name='Позиций в наличии')),
+                ('min_price', models.PositiveIntegerField(blank=True, null=True, verbose_name='Минимальная цена в наличии')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counters', to='backend.category', verbose_name='Категория')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counters', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Счетчик позиций категории',
+                'verbose_name_plural': 'Счетчики позиций категорий',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='categorycounter',
+            constraint=models.UniqueConstraint(fields=('category', 'shop'), name='unique_category_counter'),
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO backend_categorycounter (category_id, shop_id, offer_count, in_stock_count, min_price)
+            SELECT l.category_id, l.shop_id, count(*), count(*) FILTER (WHERE l.quantity > 0),
+                min(l.price) FILTER (WHERE l.quantity > 0)
+            FROM backend_productlisting l
+            GROUP BY l.category_id, l.shop_id;
+            UPDATE backend_shop s SET offer_count = t.offer_count, in_stock_count = t.in_stock_count,
+                min_price = t.min_price
+            FROM (
+                SELECT shop_id, sum(offer_count) AS offer_count, sum(in_stock_count) AS in_stock_count,
+                    min(min_price) AS min_price
+                FROM backend_categorycounter GROUP BY shop_id
+            ) t
+            WHERE s.id = t.shop_id;
+            UPDATE backend_category c SET offer_count = t.offer_count, in_stock_count = t.in_stock_count,
+                min_price = t.min_price
+            FROM (
+                SELECT k.category_id, sum(k.offer_count) AS offer_count, sum(k.in_stock_count) AS in_stock_count,
+                    min(k.min_price) AS min_price
+                FROM backend_categorycounter k JOIN backend_shop s ON s.id = k.shop_id AND s.state
+                GROUP BY k.category_id
+            ) t
+            WHERE c.id = t.category_id
+            """,
+            migrations.RunSQL.noop
+        ),
+    ]
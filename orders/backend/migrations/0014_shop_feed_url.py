@@ -0,0 +1,25 @@
+# Generated by Django 4.0.10 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_catalog_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='feed_url',
+            field=models.CharField(blank=True, max_length=300, verbose_name='Ссылка прайса с ETag и Last-Modified'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE backend_shop SET feed_url = url
+            WHERE url IS NOT NULL AND (feed_etag <> '' OR feed_last_modified <> '')
+            """,
+            migrations.RunSQL.noop
+        ),
+    ]
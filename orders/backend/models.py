@@ -1,3 +1,6 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
@@ -18,6 +21,19 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+IMPORT_STATE_CHOICES = (
+    ('new', 'Новая'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершена'),
+    ('failed', 'Ошибка'),
+)
+
+IMPORT_MODE_CHOICES = (
+    ('diff', 'Обновление изменившихся позиций'),
+    ('replace', 'Полная перезагрузка'),
+    ('staging', 'Через промежуточную таблицу'),
+)
+
 
 class UserManager(BaseUserManager):
 
@@ -78,6 +94,15 @@ class Shop(models.Model):
     url = models.URLField(verbose_name='Ссылка', null=True, blank=True)
     user = models.OneToOneField(User, verbose_name='Пользователь', blank=True, null=True, on_delete=models.CASCADE)
     state = models.BooleanField(verbose_name='Статус получения заказов', default=True)
+    price_hash = models.CharField(max_length=64, verbose_name='Хэш последнего прайса', blank=True)
+    offer_count = models.PositiveIntegerField(verbose_name='Количество позиций', default=0, editable=False)
+    in_stock_count = models.PositiveIntegerField(verbose_name='Позиций в наличии', default=0, editable=False)
+    min_price = models.PositiveIntegerField(
+        verbose_name='Минимальная цена в наличии', null=True, blank=True, editable=False
+    )
+    feed_url = models.CharField(max_length=300, verbose_name='Ссылка прайса с ETag и Last-Modified', blank=True)
+    feed_etag = models.CharField(max_length=200, verbose_name='ETag прайса по ссылке', blank=True)
+    feed_last_modified = models.CharField(max_length=50, verbose_name='Last-Modified прайса по ссылке', blank=True)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -92,6 +117,12 @@ class Category(models.Model):
 
     name = models.CharField(max_length=50, verbose_name='Название')
     shops = models.ManyToManyField(Shop, verbose_name='Магазины', related_name='categories', blank=True)
+    # счетчики по позициям активных магазинов
+    offer_count = models.PositiveIntegerField(verbose_name='Количество позиций', default=0, editable=False)
+    in_stock_count = models.PositiveIntegerField(verbose_name='Позиций в наличии', default=0, editable=False)
+    min_price = models.PositiveIntegerField(
+        verbose_name='Минимальная цена в наличии', null=True, blank=True, editable=False
+    )
 
     class Meta:
         verbose_name = 'Категория'
@@ -111,6 +142,7 @@ class Product(models.Model):
         verbose_name = 'Продукт'
         verbose_name_plural = 'Список продуктов'
         ordering = ('-name',)
+        indexes = [GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops'])]
 
     def __str__(self):
         return self.name
@@ -129,11 +161,15 @@ class ProductInfo(models.Model):
     price = models.PositiveIntegerField(verbose_name='Цена')
     price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
     external_id = models.PositiveIntegerField(verbose_name='Внешний id')
+    content_hash = models.CharField(max_length=32, verbose_name='Хэш позиции прайса', blank=True)
+    search_vector = SearchVectorField(verbose_name='Вектор поиска', null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = 'Информация о продукте'
         verbose_name_plural = 'Информационный список о продуктах'
         constraints = [models.UniqueConstraint(fields=['product', 'shop', 'external_id'], name='unique_product_info')]
+        # загрузка прайса и обновление остатков сопоставляют позиции магазина по external_id
+        indexes = [models.Index(fields=['shop', 'external_id'], name='product_info_shop_external')]
 
 
 class Parameter(models.Model):
@@ -167,6 +203,80 @@ class ProductParameter(models.Model):
         verbose_name = 'Параметр продукта'
         verbose_name_plural = 'Список параметров'
         constraints = [models.UniqueConstraint(fields=['product_info', 'parameter'], name='unique_product_parameter')]
+        indexes = [models.Index(fields=['parameter', 'value'], name='product_parameter_value')]
+
+
+# число позиций магазина в категории с данным значением параметра, пересчитывается при загрузке прайса
+class ParameterFacet(models.Model):
+
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='facets', on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='facets', on_delete=models.CASCADE)
+    parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='facets', on_delete=models.CASCADE)
+    value = models.CharField(max_length=80, verbose_name='Значение')
+    count = models.PositiveIntegerField(verbose_name='Количество позиций')
+
+    class Meta:
+        verbose_name = 'Значение фильтра'
+        verbose_name_plural = 'Значения фильтров'
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'shop', 'parameter', 'value'], name='unique_parameter_facet')
+        ]
+
+
+class CategoryCounter(models.Model):
+
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='counters', on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='counters', on_delete=models.CASCADE)
+    offer_count = models.PositiveIntegerField(verbose_name='Количество позиций')
+    in_stock_count = models.PositiveIntegerField(verbose_name='Позиций в наличии')
+    min_price = models.PositiveIntegerField(verbose_name='Минимальная цена в наличии', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Счетчик позиций категории'
+        verbose_name_plural = 'Счетчики позиций категорий'
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'shop'], name='unique_category_counter')
+        ]
+
+
+# витрина: одна строка на позицию магазина со всеми данными для списка товаров, пересчитывается при загрузке прайса
+class ProductListing(models.Model):
+
+    id = models.BigIntegerField(primary_key=True, verbose_name='Id информации о продукте')
+    product_id = models.BigIntegerField(verbose_name='Id продукта')
+    product_name = models.CharField(max_length=80, verbose_name='Название продукта')
+    category_id = models.BigIntegerField(verbose_name='Id категории')
+    category_name = models.CharField(max_length=50, verbose_name='Категория')
+    shop_id = models.BigIntegerField(verbose_name='Id магазина')
+    shop_name = models.CharField(max_length=50, verbose_name='Магазин')
+    shop_state = models.BooleanField(verbose_name='Статус получения заказов')
+    model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    parameters = models.JSONField(verbose_name='Параметры', default=list)
+    search_vector = SearchVectorField(verbose_name='Вектор поиска', null=True, blank=True, editable=False)
+
+    class Meta:
+        verbose_name = 'Позиция витрины'
+        verbose_name_plural = 'Витрина'
+        indexes = [
+            GinIndex(fields=['search_vector'], name='listing_search'),
+            models.Index(fields=['price', 'id'], name='listing_price'),
+            models.Index(fields=['category_id', 'price', 'id'], name='listing_category_price'),
+            models.Index(fields=['category_id', 'product_name', 'id'], name='listing_category_name'),
+            models.Index(fields=['shop_id', 'price', 'id'], name='listing_shop_price'),
+            # витрина чаще всего показывает только товары в наличии
+            models.Index(
+                fields=['category_id', 'price', 'id'], condition=models.Q(quantity__gt=0),
+                name='listing_category_in_stock'
+            ),
+            # сравнение цен магазинов по товару
+            models.Index(
+                fields=['product_id', 'price', 'id'], condition=models.Q(quantity__gt=0, shop_state=True),
+                name='listing_product_offers'
+            ),
+        ]
 
 
 class Contact(models.Model):
@@ -196,6 +306,7 @@ class Order(models.Model):
         User, verbose_name='Пользователь', related_name='orders', blank=True, on_delete=models.CASCADE
     )
     dt = models.DateTimeField(auto_now_add=True, verbose_name='Дата заказа')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменен')
     state = models.CharField(max_length=15, choices=STATE_CHOICES, verbose_name='Статус')
     contact = models.ForeignKey(
         Contact, verbose_name='Контакт', related_name='orders', blank=True, null=True, on_delete=models.CASCADE
@@ -227,3 +338,43 @@ class OrderItem(models.Model):
         verbose_name = 'Заказанная позиция'
         verbose_name_plural = 'Список заказанных позиций'
         constraints = [models.UniqueConstraint(fields=['order', 'product_info'], name='unique_order_item')]
+
+
+class ImportJob(models.Model):
+
+    user = models.ForeignKey(
+        User, verbose_name='Пользователь', related_name='import_jobs', blank=True, on_delete=models.CASCADE
+    )
+    shop = models.ForeignKey(
+        Shop, verbose_name='Магазин', related_name='import_jobs', blank=True, null=True, on_delete=models.SET_NULL
+    )
+    url = models.CharField(max_length=300, verbose_name='Источник прайса')
+    format = models.CharField(max_length=10, verbose_name='Формат прайса', default='yaml')
+    mode = models.CharField(max_length=10, choices=IMPORT_MODE_CHOICES, verbose_name='Режим загрузки', default='diff')
+    state = models.CharField(max_length=15, choices=IMPORT_STATE_CHOICES, verbose_name='Статус', default='new')
+    rows = models.PositiveIntegerField(verbose_name='Загружено позиций', default=0)
+    statistics = models.JSONField(verbose_name='Статистика', default=dict, blank=True)
+    errors = models.JSONField(verbose_name='Ошибки', default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    finished_at = models.DateTimeField(verbose_name='Завершена', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Загрузка прайса'
+        verbose_name_plural = 'Список загрузок прайса'
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'{self.url} ({self.get_state_display()})'
+
+    @property
+    def progress_key(self):
+        return f'import-job-{self.id}'
+
+    def set_progress(self, rows):
+        """ Сохранить прогресс загрузки в кэш, пока транзакция импорта не завершена """
+        cache.set(self.progress_key, rows, 24 * 60 * 60)
+
+    def get_progress(self):
+        if self.state == 'running':
+            return cache.get(self.progress_key, self.rows)
+        return self.rows
@@ -0,0 +1,109 @@
+import base64
+import json
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничный вывод по ключу сортировки
+
+    Курсор хранит значения полей сортировки последней позиции страницы, следующая страница выбирается
+    условием (поле1, поле2, ...) > значения курсора по индексу, поэтому дальние страницы стоят столько же,
+    сколько первая, и COUNT(*) не выполняется. Сортировка queryset должна заканчиваться уникальным полем.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = settings.CATALOG_PAGE_SIZE
+        self.max_page_size = settings.CATALOG_MAX_PAGE_SIZE
+        self.next_cursor = None
+        self.request = None
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param, '')
+        if value.isdigit() and int(value) > 0:
+            return min(int(value), self.max_page_size)
+        return self.page_size
+
+    @staticmethod
+    def encode_cursor(values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request, ordering):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is None:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except ValueError:
+            raise NotFound('Неверный курсор')
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound('Неверный курсор')
+        return values
+
+    @staticmethod
+    def after(ordering, values):
+        """ Условие "строка после курсора" для сортировки с произвольными направлениями полей """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = f'{name}__lt' if field.startswith('-') else f'{name}__gt'
+            condition |= equal & Q(**{lookup: value})
+            equal &= Q(**{name: value})
+        return condition
+
+    @staticmethod
+    def value(obj, field):
+        """ Значение поля сортировки у объекта модели или строки values() """
+        if isinstance(obj, dict):
+            return obj[field.lstrip('-')]
+        for attr in field.lstrip('-').split('__'):
+            obj = getattr(obj, attr)
+        return obj
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = [str(field) for field in queryset.query.order_by] or ['id']
+        if 'id' not in ordering and '-id' not in ordering:
+            ordering.append('id')
+        queryset = queryset.order_by(*ordering)
+        values = self.decode_cursor(request, ordering)
+        if values is not None:
+            queryset = queryset.filter(self.after(ordering, values))
+        page_size = self.get_page_size(request)
+        page = list(queryset[:page_size + 1])
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_cursor = self.encode_cursor([self.value(page[-1], field) for field in ordering])
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query', 'schema': {'type': 'integer'}},
+        ]
@@ -0,0 +1,234 @@
+import csv
+import io
+import json
+from collections import namedtuple
+from collections.abc import Hashable
+from urllib.parse import urlparse
+from yaml import AliasEvent, MappingEndEvent, MappingStartEvent, MarkedYAMLError, ScalarEvent, ScalarNode, \
+    SequenceEndEvent, SequenceStartEvent
+from yaml.constructor import ConstructorError
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+FORMATS = ('yaml', 'jsonl', 'csv')
+EXTENSIONS = {'.yaml': 'yaml', '.yml': 'yaml', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.csv': 'csv'}
+ITEM_KEYS = ('id', 'category', 'model', 'name', 'price', 'price_rrc', 'quantity', 'parameters')
+INTEGER_KEYS = ('id', 'category', 'price', 'price_rrc', 'quantity')
+CSV_COLUMNS = ('shop', 'category', 'category_name', 'id', 'model', 'name', 'price', 'price_rrc', 'quantity')
+CSV_INTEGER_COLUMNS = ('category', 'id', 'price', 'price_rrc', 'quantity')
+# id товаров и категорий запоминаются при проверке, только если это скаляры: список не может быть ключом
+SCALARS = (str, int, float)
+
+MAX_ERRORS = 100
+
+# запись прайса: kind - 'shop', 'category' или 'item', line - номер строки в файле
+Record = namedtuple('Record', ('kind', 'value', 'line'))
+
+
+class PriceListError(ValueError):
+    """ Ошибка разбора прайса с номером строки """
+
+    def __init__(self, line, message):
+        super().__init__(f'Строка {line}: {message}')
+        self.line = line
+        self.message = message
+
+
+def guess_format(name):
+    """ Определить формат прайса по имени файла или ссылке """
+    path = urlparse(name).path.lower()
+    for extension, fmt in EXTENSIONS.items():
+        if path.endswith(extension):
+            return fmt
+    return 'yaml'
+
+
+def read_price_list(stream, fmt='yaml'):
+    """ Потоково прочитать прайс из бинарного потока """
+    if fmt == 'yaml':
+        return read_yaml(stream)
+    if fmt == 'jsonl':
+        return read_jsonl(stream)
+    if fmt == 'csv':
+        return read_csv(stream)
+    raise ValueError(f'Неизвестный формат прайса: {fmt}')
+
+
+def _build(loader):
+    """ Собрать объект из событий парсера, не строя дерево всего документа """
+    event = loader.get_event()
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        node = ScalarNode(tag, event.value, event.start_mark, event.end_mark, event.style)
+        constructor = loader.yaml_constructors.get(tag, loader.yaml_constructors[None])
+        return constructor(loader, node)
+    if isinstance(event, MappingStartEvent):
+        value = {}
+        while not loader.check_event(MappingEndEvent):
+            line = loader.peek_event().start_mark.line + 1
+            key = _build(loader)
+            if not isinstance(key, Hashable):
+                raise PriceListError(line, 'ключ словаря должен быть строкой или числом')
+            value[key] = _build(loader)
+        loader.get_event()
+        return value
+    if isinstance(event, SequenceStartEvent):
+        value = []
+        while not loader.check_event(SequenceEndEvent):
+            value.append(_build(loader))
+        loader.get_event()
+        return value
+    if isinstance(event, AliasEvent):
+        raise ConstructorError(None, None, 'ссылки (aliases) в прайсе не поддерживаются', event.start_mark)
+    raise ConstructorError(None, None, f'неожиданное событие {event}', getattr(event, 'start_mark', None))
+
+
+def _read_sequence(loader, kind):
+    loader.get_event()
+    while not loader.check_event(SequenceEndEvent):
+        line = loader.peek_event().start_mark.line + 1
+        yield Record(kind, _build(loader), line)
+    loader.get_event()
+
+
+def read_yaml(stream):
+    """ Прочитать прайс в формате YAML по одной позиции """
+    loader = SafeLoader(stream)
+    try:
+        # StreamStart, DocumentStart, MappingStart; у пустого файла после StreamEnd событий нет (None)
+        events = [loader.get_event() for _ in range(3)]
+        if not isinstance(events[2], MappingStartEvent):
+            line = events[2].start_mark.line + 1 if events[2] is not None else 1
+            raise PriceListError(line, 'прайс пуст или не является словарем с ключами shop, categories и goods')
+        while not loader.check_event(MappingEndEvent):
+            line = loader.peek_event().start_mark.line + 1
+            key = _build(loader)
+            if key == 'shop':
+                yield Record('shop', _build(loader), line)
+            elif key == 'categories' and loader.check_event(SequenceStartEvent):
+                yield from _read_sequence(loader, 'category')
+            elif key == 'goods' and loader.check_event(SequenceStartEvent):
+                yield from _read_sequence(loader, 'item')
+            else:
+                _build(loader)
+    finally:
+        loader.dispose()
+
+
+def read_jsonl(stream):
+    """ Прочитать прайс в формате JSON lines: заголовок с shop и categories, затем по товару в строке """
+    for line, text in enumerate(io.TextIOWrapper(stream, encoding='utf-8'), start=1):
+        if not text.strip():
+            continue
+        try:
+            value = json.loads(text)
+        except ValueError as error:
+            raise PriceListError(line, str(error))
+        if isinstance(value, dict) and 'shop' in value:
+            yield Record('shop', value['shop'], line)
+            for category in value.get('categories', []):
+                yield Record('category', category, line)
+        else:
+            yield Record('item', value, line)
+
+
+def _csv_rows(reader):
+    """ Строки CSV, ошибка разбора (например, слишком длинное поле) - ошибка прайса с номером строки """
+    try:
+        yield from reader
+    except csv.Error as error:
+        # строка с ошибкой еще не учтена в line_num
+        raise PriceListError(reader.line_num + 1, str(error))
+
+
+def read_csv(stream):
+    """ Прочитать прайс в формате CSV, лишние колонки считаются параметрами товара """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+    shop = None
+    categories = set()
+    for row in _csv_rows(reader):
+        for column in CSV_INTEGER_COLUMNS:
+            value = row.get(column)
+            if value is not None and value.strip().isdigit():
+                row[column] = int(value)
+        if shop is None and row.get('shop'):
+            shop = row['shop']
+            yield Record('shop', shop, reader.line_num)
+        if row.get('category_name') and row.get('category') not in categories:
+            categories.add(row['category'])
+            yield Record('category', {'id': row['category'], 'name': row['category_name']}, reader.line_num)
+        item = {column: row[column] for column in CSV_COLUMNS[3:] if column in row}
+        item['category'] = row.get('category')
+        item['parameters'] = {
+            name: value for name, value in row.items()
+            if name not in CSV_COLUMNS and name is not None and value not in (None, '')
+        }
+        yield Record('item', item, reader.line_num)
+
+
+def validate_price_list(records, max_errors=MAX_ERRORS):
+    """
+    Проверить прайс за один проход, не обращаясь к БД
+
+    Проверяются обязательные ключи, целые неотрицательные цены и количества, ссылки на категории,
+    не объявленные в прайсе, и повторяющиеся id товаров. Возвращает число позиций и список ошибок.
+    """
+    errors = []
+    rows = 0
+    shop = False
+    categories = set()
+    references = {}
+    external_ids = {}
+
+    def error(line, message):
+        if len(errors) < max_errors:
+            errors.append({'line': line, 'error': message})
+
+    try:
+        for record in records:
+            value = record.value
+            if record.kind == 'shop':
+                shop = True
+                if not value:
+                    error(record.line, 'не указано название магазина')
+                continue
+            if not isinstance(value, dict):
+                error(record.line, 'ожидается объект')
+                continue
+            if record.kind == 'category':
+                if not {'id', 'name'} <= value.keys():
+                    error(record.line, 'у категории должны быть id и name')
+                if isinstance(value.get('id'), SCALARS):
+                    categories.add(value['id'])
+                continue
+            rows += 1
+            missing = [key for key in ITEM_KEYS if key not in value]
+            if missing:
+                error(record.line, f'не указаны поля: {", ".join(missing)}')
+            for key in INTEGER_KEYS:
+                if key in value and (not isinstance(value[key], int) or isinstance(value[key], bool) or value[key] < 0):
+                    error(record.line, f'{key} должно быть целым неотрицательным числом')
+            if 'parameters' in value and not isinstance(value['parameters'], dict):
+                error(record.line, 'parameters должно быть словарем')
+            if isinstance(value.get('category'), SCALARS):
+                references.setdefault(value['category'], record.line)
+            if isinstance(value.get('id'), SCALARS):
+                if value['id'] in external_ids:
+                    error(record.line, f'id {value["id"]} повторяет позицию в строке {external_ids[value["id"]]}')
+                else:
+                    external_ids[value['id']] = record.line
+    except MarkedYAMLError as parse_error:
+        error(getattr(parse_error.problem_mark, 'line', 0) + 1, parse_error.problem)
+    except PriceListError as parse_error:
+        error(parse_error.line, parse_error.message)
+    if not shop:
+        error(1, 'в прайсе не указан магазин')
+    for category_id, line in references.items():
+        if category_id not in categories:
+            error(line, f'неизвестная категория {category_id}')
+    return {'rows': rows, 'errors': sorted(errors, key=lambda item: item['line'])}
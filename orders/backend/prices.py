@@ -0,0 +1,51 @@
+from django.db import connection
+
+BEST_OFFERS = 3
+MAX_BEST_OFFERS = 50
+MAX_PRODUCTS = 100
+
+# окна по товару считаются по индексу listing_product_offers: предложения в наличии уже упорядочены по цене
+PRICES_SQL = """
+    SELECT product_id, product_name, offers, min_price, avg_price, max_price,
+        id, model, shop_id, shop_name, quantity, price, price_rrc
+    FROM (
+        SELECT l.product_id, l.product_name, l.id, l.model, l.shop_id, l.shop_name, l.quantity, l.price, l.price_rrc,
+            row_number() OVER (PARTITION BY l.product_id ORDER BY l.price, l.id) AS position,
+            count(*) OVER product AS offers,
+            min(l.price) OVER product AS min_price,
+            round(avg(l.price) OVER product, 2) AS avg_price,
+            max(l.price) OVER product AS max_price
+        FROM backend_productlisting l
+        WHERE l.product_id = ANY(%(ids)s) AND l.quantity > 0 AND l.shop_state
+        WINDOW product AS (PARTITION BY l.product_id)
+    ) ranked
+    WHERE position <= %(limit)s
+    ORDER BY product_id, position
+"""
+
+
+def parse_ids(value):
+    """ Список id через запятую, None если список пуст, слишком длинный или содержит не числа """
+    ids = [item.strip() for item in (value or '').split(',') if item.strip()]
+    if not ids or len(ids) > MAX_PRODUCTS or not all(item.isdigit() for item in ids):
+        return None
+    return [int(item) for item in ids]
+
+
+def price_comparison(product_ids, limit=BEST_OFFERS):
+    """ Лучшие предложения активных магазинов по каждому товару и разброс цен в наличии """
+    with connection.cursor() as cursor:
+        cursor.execute(PRICES_SQL, {'ids': product_ids, 'limit': limit})
+        rows = cursor.fetchall()
+    result = {}
+    for (product_id, product_name, offers, min_price, avg_price, max_price,
+         offer_id, model, shop_id, shop_name, quantity, price, price_rrc) in rows:
+        product = result.setdefault(product_id, {
+            'product': {'id': product_id, 'name': product_name}, 'offers': offers,
+            'min_price': min_price, 'avg_price': avg_price, 'max_price': max_price, 'best_offers': []
+        })
+        product['best_offers'].append({
+            'id': offer_id, 'model': model, 'shop': {'id': shop_id, 'name': shop_name},
+            'quantity': quantity, 'price': price, 'price_rrc': price_rrc
+        })
+    return list(result.values())
@@ -0,0 +1,75 @@
+import json
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.utils import encoders
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = encoders.JSONEncoder()
+
+
+def dumps(data):
+    """
+    JSON в UTF-8 без экранирования кириллицы, в том же виде, что и JSONRenderer DRF
+
+    Типы, которых нет в orjson (Decimal, ленивые строки, QuerySet), преобразует JSONEncoder DRF.
+    Ключи словаря не строками и целые больше 64 бит orjson не поддерживает, такие данные рендерит json.
+    """
+    content = None
+    if orjson is not None:
+        try:
+            content = orjson.dumps(data, default=_encoder.default, option=orjson.OPT_UTC_Z)
+        except orjson.JSONEncodeError:
+            pass
+    if content is None:
+        content = json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+    # как и JSONRenderer, экранируем разделители строк, которые недопустимы в строках JavaScript
+    return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def loads(content):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """ Рендерер JSON на orjson, форматированный вывод (browsable API, indent) остается за JSONRenderer """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    """ Разбор тела запроса JSON на orjson """
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return loads(stream.read())
+        except ValueError as error:
+            raise ParseError(f'JSON parse error - {error}')
+
+
+class JsonResponse(HttpResponse):
+    """ Замена django.http.JsonResponse с тем же кодировщиком, что и у API """
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError('In order to allow non-dict objects to be serialized set the safe parameter to False.')
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,57 @@
+from rest_framework.fields import DateTimeField
+from .models import OrderItem
+
+# поля витрины, которые читаются через values() для списка товаров
+LISTING_FIELDS = (
+    'id', 'model', 'product_id', 'product_name', 'shop_id', 'quantity', 'price', 'price_rrc', 'parameters'
+)
+
+ORDER_FIELDS = ('id', 'state', 'dt')
+
+# поле сериализатора используется только как готовый форматтер даты, как в OrderSerializer
+_datetime = DateTimeField()
+
+
+def listing_parameters(parameters):
+    """ Параметры позиции витрины: jsonb хранит ключи в своем порядке, восстанавливаем порядок сериализатора """
+    return [{'parameter': parameter['parameter'], 'value': parameter['value']} for parameter in parameters]
+
+
+def listing_row(row):
+    """ Позиция витрины из values() в том же виде, что и ProductListingSerializer """
+    return {
+        'id': row['id'],
+        'model': row['model'],
+        'product': {'id': row['product_id'], 'name': row['product_name']},
+        'shop': row['shop_id'],
+        'quantity': row['quantity'],
+        'price': row['price'],
+        'price_rrc': row['price_rrc'],
+        'product_parameters': listing_parameters(row['parameters']),
+    }
+
+
+def build_order_rows(orders, items):
+    """ Заказы из кортежей (id, state, dt) и позиций (order_id, id, product_info_id, quantity) """
+    ordered_items = {}
+    for order_id, item_id, product_info_id, quantity in items:
+        ordered_items.setdefault(order_id, []).append(
+            {'id': item_id, 'product_info': product_info_id, 'quantity': quantity}
+        )
+    return [
+        {'id': order_id, 'ordered_items': ordered_items.get(order_id, []), 'state': state,
+         'dt': _datetime.to_representation(dt)}
+        for order_id, state, dt in orders
+    ]
+
+
+def order_items(order_ids):
+    return OrderItem.objects.filter(order_id__in=order_ids).order_by('id').values_list(
+        'order_id', 'id', 'product_info_id', 'quantity'
+    )
+
+
+def order_rows(orders):
+    """ Заказы в том же виде, что и OrderSerializer, двумя запросами без создания объектов моделей """
+    orders = list(orders.values_list(*ORDER_FIELDS))
+    return build_order_rows(orders, order_items([order[0] for order in orders]))
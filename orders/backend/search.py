@@ -0,0 +1,53 @@
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from .models import Product
+
+SEARCH_CONFIG = 'russian'
+
+# вектор поиска позиции: название продукта, модель, категория и значения параметров с убывающим весом
+SEARCH_VECTOR_SQL = f"""
+    UPDATE backend_productinfo pi SET search_vector =
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(p.name, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(pi.model, '')), 'B') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(c.name, '')), 'C') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+            SELECT string_agg(pp.value, ' ') FROM backend_productparameter pp WHERE pp.product_info_id = pi.id
+        ), '')), 'D')
+    FROM backend_product p JOIN backend_category c ON c.id = p.category_id
+    WHERE p.id = pi.product_id
+"""
+
+
+def refresh_search_vectors(shop_id):
+    """ Заполнить вектор поиска у новых и измененных позиций магазина """
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_VECTOR_SQL + ' AND pi.shop_id = %s AND pi.search_vector IS NULL', [shop_id])
+
+
+def refresh_offer_search_vectors(offer_ids):
+    """ Пересчитать вектор поиска позиций после правки товара, категории или параметров вне загрузки прайса """
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_VECTOR_SQL + ' AND pi.id = ANY(%s)', [list(offer_ids)])
+
+
+def search_products(queryset, text):
+    """
+    Полнотекстовый поиск позиций с ранжированием
+
+    Слова ищутся по префиксу в векторе поиска. Если ничего не найдено, запрос считается опечаткой
+    и позиции подбираются по триграммному индексу названий продуктов.
+    """
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return queryset
+    query = SearchQuery(' & '.join(f'{word}:*' for word in words), config=SEARCH_CONFIG, search_type='raw')
+    found = queryset.filter(search_vector=query)
+    if found.exists():
+        # ts_rank возвращает float4, а курсор постраничного вывода хранит double: без приведения
+        # сравнение с курсором не проходит дальше последней строки страницы
+        return found.annotate(rank=Cast(SearchRank(F('search_vector'), query), FloatField())).order_by('-rank', 'id')
+    similar = Product.objects.filter(name__trigram_word_similar=' '.join(words)).values('id')
+    return queryset.filter(product_id__in=similar).order_by('id')
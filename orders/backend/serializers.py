@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import Contact, User, Product, ProductParameter, ProductInfo, Order, OrderItem, Category, Shop
+from .models import Contact, User, Product, ProductParameter, ProductInfo, ProductListing, Order, OrderItem, Category, \
+    Shop, ImportJob
+from .rows import listing_parameters
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -49,6 +51,25 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class ProductListingSerializer(serializers.ModelSerializer):
+    """ Позиция витрины в том же виде, что и ProductInfoSerializer """
+
+    product = serializers.SerializerMethodField()
+    shop = serializers.IntegerField(source='shop_id')
+    product_parameters = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductListing
+        fields = ('id', 'model', 'product', 'shop', 'quantity', 'price', 'price_rrc', 'product_parameters',)
+        read_only_fields = fields
+
+    def get_product(self, obj):
+        return {'id': obj.product_id, 'name': obj.product_name}
+
+    def get_product_parameters(self, obj):
+        return listing_parameters(obj.parameters)
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
@@ -72,13 +93,25 @@ class CategorySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Category
-        fields = ('id', 'name',)
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'offer_count', 'in_stock_count', 'min_price')
+        read_only_fields = ('id', 'offer_count', 'in_stock_count', 'min_price')
 
 
 class ShopSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Shop
-        fields = ('id', 'name', 'url', 'state')
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'url', 'state', 'offer_count', 'in_stock_count', 'min_price')
+        read_only_fields = ('id', 'offer_count', 'in_stock_count', 'min_price')
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+
+    rows = serializers.IntegerField(source='get_progress', read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = (
+            'id', 'url', 'format', 'mode', 'state', 'shop', 'rows', 'statistics', 'errors', 'created_at', 'finished_at'
+        )
+        read_only_fields = fields
@@ -0,0 +1,198 @@
+import threading
+from contextlib import contextmanager
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver, Signal
+from django.utils import timezone
+from .catalog_cache import bump_catalog_version_on_commit
+from .counters import category_shops, listing_pairs, refresh_counters, refresh_pair_counters, roll_up, \
+    shop_categories
+from .facets import refresh_facets
+from .listing import delete_listing, delete_listing_shop, refresh_listing, refresh_listing_offers, \
+    update_listing_category, update_listing_shop
+from .models import Category, Order, OrderItem, Parameter, Product, ProductInfo, ProductParameter, Shop
+from .search import refresh_offer_search_vectors, refresh_search_vectors
+from .suggest import bump_names_version_on_commit
+
+# каталог магазина изменился, отправляется внутри транзакции: загрузка прайса (offer_ids=None)
+# или обновление цен и остатков позиций offer_ids
+catalog_updated = Signal()
+
+_import_state = threading.local()
+# категории, удаляемые сейчас: значения их фильтров удаляются каскадом, товары категории фильтры не пересчитывают
+_deleting_categories = threading.local()
+
+
+@contextmanager
+def import_deletions():
+    """ Удаление позиций загрузкой прайса: витрину и счетчики магазина пересчитывает catalog_updated """
+    _import_state.active = True
+    try:
+        yield
+    finally:
+        _import_state.active = False
+
+
+@receiver(catalog_updated)
+def refresh_catalog(sender, shop_id, offer_ids=None, **kwargs):
+    """ Пересчитать производные данные магазина, витрина копирует вектор поиска, счетчики считаются по витрине """
+    if offer_ids is None:
+        refresh_search_vectors(shop_id)
+        refresh_facets(shop_id)
+        refresh_listing(shop_id)
+    else:
+        # цены и остатки не входят ни в вектор поиска, ни в значения фильтров: обновляются только строки витрины
+        refresh_offers(offer_ids)
+        return
+    refresh_counters(shop_id)
+
+
+def refresh_offers(offer_ids, search=False):
+    """
+    Обновить строки витрины позиций и счетчики их пар категория-магазин до и после изменения
+
+    search - пересчитать и вектор поиска: правка названий, модели или параметров, а не цен и остатков.
+    """
+    if search:
+        refresh_offer_search_vectors(offer_ids)
+    pairs = listing_pairs(offer_ids)
+    refresh_listing_offers(offer_ids)
+    refresh_pair_counters(pairs | listing_pairs(offer_ids))
+
+
+@receiver(catalog_updated)
+def invalidate_catalog_cache(sender, shop_id, offer_ids=None, **kwargs):
+    bump_catalog_version_on_commit(shop_id)
+    if offer_ids is None:
+        bump_names_version_on_commit()
+
+
+@receiver(post_save, sender=Shop)
+def shop_changed(sender, instance, **kwargs):
+    """ Смена статуса магазина меняет выдачу каталога """
+    update_listing_shop(instance)
+    roll_up(shop_categories(instance.id), [])
+    bump_catalog_version_on_commit(instance.id)
+    bump_names_version_on_commit()
+
+
+@receiver(pre_delete, sender=Shop)
+def shop_deleting(sender, instance, **kwargs):
+    """
+    Счетчики пар удаляются каскадом раньше магазина, их категории запоминаются до удаления
+
+    pre_delete всех объектов отправляется до удаления первого из них, поэтому строки витрины удаляются здесь
+    одним запросом, и каскадное удаление позиций не трогает витрину по одной строке.
+    """
+    instance.counter_categories = shop_categories(instance.id)
+    delete_listing_shop(instance)
+
+
+@receiver(post_delete, sender=Shop)
+def shop_deleted(sender, instance, **kwargs):
+    roll_up(getattr(instance, 'counter_categories', []), [])
+    bump_catalog_version_on_commit(instance.id)
+    bump_names_version_on_commit()
+
+
+@receiver(post_save, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    # название категории входит в вектор поиска ее позиций
+    if update_listing_category(instance):
+        refresh_offers(ProductInfo.objects.filter(product__category=instance).values_list('id', flat=True),
+                       search=True)
+    bump_catalog_version_on_commit()
+    bump_names_version_on_commit()
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    """ Магазины категории запоминаются по счетчикам пар, строки витрины удаляются до каскада, как у магазина """
+    instance.counter_shops = category_shops(instance.id)
+    delete_listing('category_id', [instance.id])
+    _deleting_categories.ids = getattr(_deleting_categories, 'ids', set()) | {instance.id}
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # счетчики пар категории удалены каскадом, пересчитываются итоги ее магазинов
+    roll_up([], getattr(instance, 'counter_shops', []))
+    _deleting_categories.ids = getattr(_deleting_categories, 'ids', set()) - {instance.id}
+    bump_catalog_version_on_commit()
+    bump_names_version_on_commit()
+
+
+@receiver(post_save, sender=ProductInfo)
+def product_info_changed(sender, instance, created=False, **kwargs):
+    """
+    Загрузка прайса пишет пачками без сигналов, сюда попадают правки через админку и ORM
+    """
+    refresh_offers([instance.id], search=True)
+    bump_catalog_version_on_commit(instance.shop_id)
+    # новая позиция может добавить в витрину товар, правка цены и остатков названия не меняет
+    if created:
+        bump_names_version_on_commit()
+
+
+@receiver(post_delete, sender=ProductInfo)
+def product_info_deleted(sender, instance, **kwargs):
+    """
+    Удаление позиции через админку и ORM убирает ее строку витрины
+
+    Загрузка прайса удаляет позиции внутри import_deletions и пересчитывает магазин целиком. При удалении
+    магазина, товара или категории строки уже удалены в их pre_delete, и позиция ничего не пересчитывает.
+    """
+    if getattr(_import_state, 'active', False):
+        return
+    pairs = delete_listing('id', [instance.id])
+    if pairs:
+        refresh_pair_counters(pairs)
+        refresh_facets(instance.shop_id)
+        bump_catalog_version_on_commit(instance.shop_id)
+        bump_names_version_on_commit()
+
+
+def offers_changed(offers):
+    """ Правка позиций вне загрузки прайса: обновить витрину, значения фильтров и версии каталога их магазинов """
+    rows = list(offers.values_list('id', 'shop_id'))
+    refresh_offers([offer_id for offer_id, _ in rows], search=True)
+    for shop_id in {shop_id for _, shop_id in rows}:
+        refresh_facets(shop_id)
+        bump_catalog_version_on_commit(shop_id)
+
+
+@receiver(post_save, sender=ProductParameter)
+def product_parameter_changed(sender, instance, **kwargs):
+    offers_changed(ProductInfo.objects.filter(id=instance.product_info_id))
+
+
+@receiver(post_save, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    offers_changed(instance.product_infos.all())
+    bump_names_version_on_commit()
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleting(sender, instance, **kwargs):
+    instance.listing_pairs = delete_listing('product_id', [instance.id])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    pairs = getattr(instance, 'listing_pairs', set())
+    refresh_pair_counters(pairs)
+    for shop_id in {shop_id for _, shop_id in pairs}:
+        if instance.category_id not in getattr(_deleting_categories, 'ids', set()):
+            refresh_facets(shop_id)
+        bump_catalog_version_on_commit(shop_id)
+    bump_names_version_on_commit()
+
+
+@receiver(post_save, sender=Parameter)
+def parameter_changed(sender, instance, **kwargs):
+    offers_changed(ProductInfo.objects.filter(product_parameters__parameter=instance).distinct())
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def order_item_changed(sender, instance, **kwargs):
+    """ Отметка изменения заказа входит в его ETag """
+    Order.objects.filter(id=instance.order_id).update(updated_at=timezone.now())
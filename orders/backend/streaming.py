@@ -0,0 +1,42 @@
+from itertools import islice
+from django.http import StreamingHttpResponse
+from .renderers import dumps
+from .rows import ORDER_FIELDS, build_order_rows, order_items
+
+STREAM_CHUNK_SIZE = 2000
+
+
+def is_streaming(request):
+    """ Потоковый ответ включается параметром ?stream=true """
+    return request.query_params.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def json_array(chunks):
+    """ Склеить JSON массив из пачек готовых фрагментов, не держа в памяти весь ответ """
+    separator = b''
+    yield b'['
+    for chunk in chunks:
+        if chunk:
+            yield separator + b','.join(chunk)
+            separator = b','
+    yield b']'
+
+
+def order_chunks(orders, chunk_size=STREAM_CHUNK_SIZE):
+    """ Заказы читаются серверным курсором, позиции подгружаются одним запросом на пачку """
+    for chunk in chunked(orders.values_list(*ORDER_FIELDS).iterator(chunk_size=chunk_size), chunk_size):
+        rows = build_order_rows(chunk, order_items([order[0] for order in chunk]))
+        yield [dumps(row) for row in rows]
+
+
+def streaming_json_response(chunks):
+    return StreamingHttpResponse(json_array(chunks), content_type='application/json')
@@ -0,0 +1,96 @@
+import threading
+from bisect import bisect_left
+from django.db import transaction
+from .catalog_cache import bump_version, get_version
+from .models import ProductListing
+
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+# версия названий: меняется при загрузке прайса и правке товаров, категорий и магазинов, но не остатков и цен
+NAMES_VERSION_KEY = 'catalog-names-version'
+
+
+def bump_names_version_on_commit():
+    transaction.on_commit(lambda: bump_version(NAMES_VERSION_KEY))
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+class PrefixIndex:
+    """
+    Отсортированный массив ключей для поиска по префиксу двоичным поиском
+
+    Ключом служит название, начиная с каждого слова, поэтому "iph" находит "Смартфон Apple iPhone".
+    """
+
+    def __init__(self, entries):
+        keys = []
+        for entry in entries:
+            words = normalize(entry['name']).split()
+            keys += ((' '.join(words[position:]), entry['id']) for position in range(len(words)))
+        keys.sort()
+        self.keys = [key for key, entry_id in keys]
+        self.ids = [entry_id for key, entry_id in keys]
+        self.entries = {entry['id']: entry for entry in entries}
+
+    def search(self, prefix, limit):
+        prefix = ' '.join(normalize(prefix).split())
+        found = {}
+        if not prefix:
+            return []
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and len(found) < limit and self.keys[position].startswith(prefix):
+            entry_id = self.ids[position]
+            found.setdefault(entry_id, self.entries[entry_id])
+            position += 1
+        return list(found.values())
+
+
+class Suggestions:
+    """
+    Индексы названий товаров и категорий в памяти процесса
+
+    Индекс строится из витрины (только позиции активных магазинов) и перестраивается, когда меняется версия
+    названий: ее увеличивает загрузка прайса и правка товаров, категорий и магазинов, а обновление остатков
+    и цен - нет. Проверка версии - одно чтение из кэша, к БД запрос подсказок не обращается. Пока один поток
+    перестраивает индекс, остальные отвечают по старому.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.products = self.categories = None
+        self.lock = threading.Lock()
+
+    def build(self):
+        rows = ProductListing.objects.filter(shop_state=True).values_list(
+            'product_id', 'product_name', 'category_id', 'category_name'
+        ).distinct()
+        products, categories = {}, {}
+        for product_id, product_name, category_id, category_name in rows.iterator():
+            products[product_id] = {'id': product_id, 'name': product_name, 'category': category_id}
+            categories[category_id] = {'id': category_id, 'name': category_name}
+        self.products, self.categories = PrefixIndex(list(products.values())), PrefixIndex(list(categories.values()))
+
+    def refresh(self):
+        version = get_version(NAMES_VERSION_KEY)
+        if version == self.version:
+            return
+        # первый запрос ждет построения индекса, следующие не ждут перестроения
+        if not self.lock.acquire(blocking=self.products is None):
+            return
+        try:
+            if version != self.version:
+                self.build()
+                self.version = version
+        finally:
+            self.lock.release()
+
+    def search(self, prefix, limit=SUGGEST_LIMIT):
+        self.refresh()
+        return {'products': self.products.search(prefix, limit), 'categories': self.categories.search(prefix, limit)}
+
+
+suggestions = Suggestions()
@@ -1,6 +1,12 @@
 from django.core.mail import EmailMessage
 from django.conf import settings
-from celery import shared_task
+from django.utils import timezone
+from celery import group, shared_task
+from .counters import reconcile_counters
+from .download import PriceListSource
+from .importer import make_importer
+from .models import ImportJob, Shop
+from .pricelist import read_price_list
 
 @shared_task
 def send_email(title, body, to, files_path=None):
@@ -14,3 +20,40 @@ def send_email(title, body, to, files_path=None):
         for file_path in files_path:
             email.attach_file(file_path)
     email.send()
+
+
+@shared_task
+def do_import(job_id):
+    job = ImportJob.objects.get(id=job_id)
+    job.state = 'running'
+    job.save(update_fields=['state'])
+    importer = make_importer(job.user_id, job.mode, progress=job.set_progress)
+    shop = Shop.objects.filter(user_id=job.user_id).first()
+    try:
+        with PriceListSource(job.url, shop if job.mode != 'replace' else None) as source:
+            if source.not_modified or importer.is_unchanged(source.price_hash):
+                importer.shop = shop
+                job.statistics = {'mode': job.mode, 'rows': 0, 'skipped': True}
+            else:
+                job.statistics = importer.run(read_price_list(source.stream, job.format), source.price_hash)
+                source.save_validators(importer.shop)
+    except Exception as error:
+        job.state = 'failed'
+        job.errors = [str(error)]
+    else:
+        job.state = 'done'
+        job.rows = job.statistics['rows']
+        job.shop = importer.shop
+    job.finished_at = timezone.now()
+    job.save()
+
+
+@shared_task
+def reconcile_catalog_counters():
+    """ Периодическая сверка счетчиков позиций магазинов и категорий, расписание в CELERYBEAT_SCHEDULE """
+    reconcile_counters()
+
+
+def start_imports(jobs):
+    """ Запустить загрузки параллельно на воркерах Celery, загрузки одного магазина выполняются по очереди """
+    return group(do_import.s(job.id) for job in jobs).apply_async()
@@ -3,6 +3,8 @@ from rest_framework.routers import DefaultRouter
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 from .views import (
     PartnerViewSet,
+    ImportJobView,
+    PartnerStock,
     LoginAccount,
     RegisterAccount,
     ProductInfoViewSet,
@@ -24,6 +26,8 @@ router.register(r'user/basket', BasketViewSet, basename='Bascet')
 router.register(r'partners', PartnerViewSet, basename='Partner')
 
 urlpatterns = [
+    path('partners/stock', PartnerStock.as_view(), name='partner-stock'),
+    path('partners/imports/<int:pk>', ImportJobView.as_view(), name='partner-import'),
     path('user/login', LoginAccount.as_view(), name='user-login'),
     path('user/register', RegisterAccount.as_view(), name='user-register'),
     path('schema', SpectacularAPIView.as_view(), name='schema'),
@@ -1,25 +1,57 @@
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
-from django.db.models import Q
-from django.http import JsonResponse
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from requests import RequestException
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
 from rest_framework.viewsets import ModelViewSet
-from yaml import safe_load
-from .tasks import send_email
-from .models import Shop, Category, ProductInfo, Product, Parameter, ProductParameter, Order, OrderItem, Contact
+from .tasks import send_email, do_import
+from .importer import IMPORT_MODES, update_stock
+from .download import DRY_RUN_MAX_SIZE, PriceListHostForbidden, PriceListSource, PriceListTooLarge
+from .facets import facet_counts
+from .suggest import MAX_SUGGEST_LIMIT, SUGGEST_LIMIT, suggestions
+from .prices import BEST_OFFERS, MAX_BEST_OFFERS, MAX_PRODUCTS, parse_ids, price_comparison
+from .catalog_cache import CatalogCacheMixin
+from .etags import conditional_response, make_etag
+from .fragments import OfferFragmentMixin
+from .rows import LISTING_FIELDS, listing_row, order_rows
+from .streaming import is_streaming, order_chunks, streaming_json_response
+from .pagination import KeysetPagination
+from .renderers import JsonResponse
+from .filters import ProductOrderingFilter, ProductParameterFilter, ProductPriceFilter, ProductSearchFilter
+from .pricelist import FORMATS, guess_format, read_price_list, validate_price_list
+from .models import Shop, Category, ProductListing, Order, OrderItem, Contact, ImportJob
 from .serializers import (
     UserSerializer,
-    ProductInfoSerializer,
+    ProductListingSerializer,
     OrderSerializer,
     OrderItemSerializer,
     ContactSerializer,
     CategorySerializer,
-    ShopSerializer
+    ShopSerializer,
+    ImportJobSerializer
 )
 
 
+# external_id, price и quantity хранятся в PositiveIntegerField (integer в PostgreSQL)
+MAX_INT = 2 ** 31 - 1
+
+
+def is_positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= MAX_INT
+
+
+def is_stock_item(item):
+    """ Проверить позицию обновления остатков: external_id и хотя бы одно из price, quantity """
+    if not isinstance(item, dict) or not is_positive_int(item.get('external_id')):
+        return False
+    values = [item[key] for key in ('price', 'quantity') if key in item]
+    return bool(values) and all(is_positive_int(value) for value in values)
+
+
 class PartnerViewSet(ModelViewSet):
 
     http_method_names = ['get', 'post']
@@ -33,31 +65,24 @@ class PartnerViewSet(ModelViewSet):
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
         url = request.data.get('url')
         if url:
-            with open(url, encoding='utf-8') as f:
-                data = safe_load(f)
-            shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=request.user.id)
-            for category in data['categories']:
-                category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                category_object.shops.add(shop.id)
-                category_object.save()
-            ProductInfo.objects.filter(shop_id=shop.id).delete()
-            for item in data['goods']:
-                product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-                product_info = ProductInfo.objects.create(
-                    product_id=product.id,
-                    external_id=item['id'],
-                    model=item['model'],
-                    price=item['price'],
-                    price_rrc=item['price_rrc'],
-                    quantity=item['quantity'],
-                    shop_id=shop.id
-                )
-                for name, value in item['parameters'].items():
-                    parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                    ProductParameter.objects.create(
-                        product_info_id=product_info.id, parameter_id=parameter_object.id, value=value
-                    )
-            return JsonResponse({'Status': True})
+            fmt = request.data.get('format') or guess_format(url)
+            if fmt not in FORMATS:
+                return JsonResponse({'Status': False, 'Errors': f'Неизвестный формат прайса: {fmt}'})
+            mode = request.data.get('mode', 'diff')
+            if mode not in IMPORT_MODES:
+                return JsonResponse({'Status': False, 'Errors': f'Неизвестный режим загрузки: {mode}'})
+            if str(request.data.get('dry_run', '')).lower() in ('true', '1'):
+                try:
+                    with PriceListSource(url, max_size=DRY_RUN_MAX_SIZE) as source:
+                        report = validate_price_list(read_price_list(source.stream, fmt))
+                except (OSError, ValueError, RequestException, PriceListTooLarge, PriceListHostForbidden) as error:
+                    return JsonResponse({'Status': False, 'Errors': str(error)})
+                return JsonResponse({
+                    'Status': not report['errors'], 'Проверено позиций': report['rows'], 'Errors': report['errors']
+                })
+            job = ImportJob.objects.create(user_id=request.user.id, url=url, format=fmt, mode=mode)
+            do_import.delay(job.id)
+            return JsonResponse({'Status': True, 'Task': job.id}, status=202)
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
     def list(self, request, *args, **kwargs):
@@ -67,12 +92,50 @@ class PartnerViewSet(ModelViewSet):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
         order = Order.objects.filter(
-            ordered_items__product_info__shop__user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category').distinct()
+            ordered_items__product_info__shop__user_id=request.user.id).exclude(state='basket').distinct()
+        if is_streaming(request):
+            return streaming_json_response(order_chunks(order))
+        order = order.prefetch_related('ordered_items__product_info__product__category')
         serializer = OrderSerializer(order, many=True)
         return Response(serializer.data)
 
 
+class PartnerStock(APIView):
+    """ Обновление цен и остатков поставщика """
+
+    def post(self, request, *args, **kwargs):
+        """ Применить изменения цен и остатков по external_id """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+        items = request.data.get('items')
+        if not isinstance(items, list) or not items:
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        shop = Shop.objects.filter(user_id=request.user.id).first()
+        if shop is None:
+            return JsonResponse({'Status': False, 'Errors': 'Магазин не найден'})
+        for index, item in enumerate(items):
+            if not is_stock_item(item):
+                return JsonResponse({'Status': False, 'Errors': f'Некорректная позиция {index}: {item}'})
+        updated = update_stock(shop, items)
+        not_found = sorted({item['external_id'] for item in items} - set(updated))
+        return JsonResponse({'Status': True, 'Обновлено позиций': len(updated), 'Не найдено': not_found})
+
+
+class ImportJobView(APIView):
+    """ Статус загрузки прайса """
+
+    def get(self, request, pk, *args, **kwargs):
+        """ Получить статус и прогресс загрузки """
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Только для зарегистрированных пользователей'}, status=403)
+        job = ImportJob.objects.filter(id=pk, user_id=request.user.id).first()
+        if job is None:
+            return JsonResponse({'Status': False, 'Errors': 'Загрузка не найдена'}, status=404)
+        return Response(ImportJobSerializer(job).data)
+
+
 class LoginAccount(APIView):
 
     def post(self, request, *args, **kwargs):
@@ -116,24 +179,62 @@ class RegisterAccount(APIView):
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
-class ProductInfoViewSet(ModelViewSet):
+class ProductInfoViewSet(CatalogCacheMixin, OfferFragmentMixin, ModelViewSet):
     """ Список продуктов """
 
-    serializer_class = ProductInfoSerializer
-    search_fields = ['product__name', 'model']
+    serializer_class = ProductListingSerializer
+    filter_backends = [ProductSearchFilter, ProductParameterFilter, ProductPriceFilter, ProductOrderingFilter]
+    pagination_class = KeysetPagination
+    fragment_fields = LISTING_FIELDS
+    shop_scoped_actions = ('list', 'retrieve')
+    fragment_row = staticmethod(listing_row)
+    search_fields = ['product_name', 'model']
     http_method_names = ['get']
 
     def get_queryset(self):
-        query = Q(shop__state=True)
+        """ Позиции читаются из витрины одной таблицей, без соединений и вложенных сериализаторов """
+        query = Q(shop_state=True)
         shop_id = self.request.GET.get('shop_id', None)
         category_id = self.request.GET.get('category_id', None)
         if shop_id:
             query = query & Q(shop_id=shop_id)
         if category_id:
-            query = query & Q(product__category_id=category_id)
-        queryset = ProductInfo.objects.filter(query).select_related(
-            'shop', 'product').distinct()
-        return queryset
+            query = query & Q(category_id=category_id)
+        return ProductListing.objects.filter(query)
+
+    @action(detail=False)
+    def facets(self, request, *args, **kwargs):
+        """ Значения параметров категории с числом позиций для фильтров """
+        category_id = request.GET.get('category_id', None)
+        if not category_id or not category_id.isdigit():
+            return JsonResponse({'Status': False, 'Errors': 'Не указана категория'}, status=400)
+        shop_id = request.GET.get('shop_id', None)
+        if shop_id and not shop_id.isdigit():
+            return JsonResponse({'Status': False, 'Errors': 'Неверный id магазина'}, status=400)
+        return Response(facet_counts(int(category_id), int(shop_id) if shop_id else None))
+
+    @action(detail=False)
+    def suggest(self, request, *args, **kwargs):
+        """ Подсказки названий товаров и категорий по началу слова из индекса в памяти """
+        limit = request.GET.get('limit', str(SUGGEST_LIMIT))
+        if not limit.isdigit() or not 0 < int(limit) <= MAX_SUGGEST_LIMIT:
+            return JsonResponse({'Status': False, 'Errors': f'limit должен быть от 1 до {MAX_SUGGEST_LIMIT}'},
+                                status=400)
+        return Response(suggestions.search(request.GET.get('q', ''), int(limit)))
+
+    @action(detail=False)
+    def prices(self, request, *args, **kwargs):
+        """ Сравнение цен магазинов: лучшие предложения в наличии и минимальная, средняя и максимальная цена """
+        product_ids = parse_ids(request.GET.get('product_id', None))
+        if product_ids is None:
+            return JsonResponse({'Status': False, 'Errors': f'Укажите до {MAX_PRODUCTS} id товаров через запятую'},
+                                status=400)
+        limit = request.GET.get('limit', str(BEST_OFFERS))
+        if not limit.isdigit() or not 0 < int(limit) <= MAX_BEST_OFFERS:
+            return JsonResponse({'Status': False, 'Errors': f'limit должен быть от 1 до {MAX_BEST_OFFERS}'}, status=400)
+        return self.conditional_cached_response(request, lambda request: Response(
+            price_comparison(product_ids, int(limit))
+        ))
 
 
 class BasketViewSet(ModelViewSet):
@@ -273,12 +374,16 @@ class OrderViewSet(ModelViewSet):
         """ получить мои заказы """
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Только для зарегистрированных пользователей'}, status=403)
-        order = Order.objects.filter(
-            user_id=request.user.id).exclude(state='basket').prefetch_related(
-            'ordered_items__product_info__product__category',
-            'ordered_items__product_info__product_parameters__parameter').select_related('contact').distinct()
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        orders = Order.objects.filter(user_id=request.user.id).exclude(state='basket')
+        changed = orders.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+        etag = make_etag('orders', request.user.id, changed['count'], changed['updated_at'])
+        return conditional_response(request, etag, self.serialize_orders, orders)
+
+    @staticmethod
+    def serialize_orders(request, orders):
+        if is_streaming(request):
+            return streaming_json_response(order_chunks(orders))
+        return Response(order_rows(orders))
 
     def create(self, request, *args, **kwargs):
         """ сделать новый заказ из корзины """
@@ -289,13 +394,13 @@ class OrderViewSet(ModelViewSet):
             data = Order.objects.filter(id=id_order, user=request.user.id, state='basket')
             if len(data) == 0:
                 return JsonResponse({'Status': False, 'Errors': 'Не найдена корзина пользователя'})
-            data.update(state='new', contact_id=request.data['contact'])
+            data.update(state='new', contact_id=request.data['contact'], updated_at=timezone.now())
             send_email('Подтверждение заказа', 'Заказ успешно принят в обработку!', [request.user.email])
             return JsonResponse({'Status': True})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
-class CategoryViewSet(ModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, ModelViewSet):
     """ Просмотр категорий """
 
     queryset = Category.objects.all()
@@ -304,7 +409,7 @@ class CategoryViewSet(ModelViewSet):
     http_method_names = ['get']
 
 
-class ShopViewSet(ModelViewSet):
+class ShopViewSet(CatalogCacheMixin, ModelViewSet):
     """ Просмотр магазинов """
 
     serializer_class = ShopSerializer
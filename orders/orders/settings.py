@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
     'rest_framework.authtoken',
     'backend',
     'rest_framework',
@@ -152,6 +153,15 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'backend.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'backend.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_THROTTLE_CLASSES': [
         'rest_framework.throttling.AnonRateThrottle',
@@ -175,6 +185,33 @@ EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 BROKER_URL = 'redis://localhost:6379'
 ACCEPT_CONTENT = ['application/json']
 TASK_SERIALIZER = 'json'
+CELERYBEAT_SCHEDULE = {
+    'reconcile-catalog-counters': {
+        'task': 'backend.tasks.reconcile_catalog_counters',
+        'schedule': 60 * 60,
+    },
+}
+
+# Cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+    }
+}
+
+# Hosts allowed for price list download besides public addresses, e.g. an internal feed server
+PRICE_LIST_ALLOWED_HOSTS = []
+
+# Directories local price list files may be imported from
+PRICE_LIST_DIRS = [BASE_DIR / 'data']
+
+# Catalog pagination
+CATALOG_PAGE_SIZE = 50
+CATALOG_MAX_PAGE_SIZE = 500
+
+# Catalog response cache, invalidated by catalog version on import
+CATALOG_CACHE_TIMEOUT = 60 * 60
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Backend API',
@@ -1,8 +1,29 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import pytest
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from model_bakery import baker
+from orders import cellery_app
+
+
+@pytest.fixture(autouse=True)
+def local_services(settings):
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def eager_tasks():
+    """ Задачи Celery выполняются сразу в процессе теста, после теста настройка восстанавливается """
+    always_eager = cellery_app.conf.task_always_eager
+    cellery_app.conf.task_always_eager = True
+    yield
+    cellery_app.conf.task_always_eager = always_eager
+
 
 @pytest.fixture
 def api_client():
@@ -21,6 +42,61 @@ def simple_user_client():
     return client
 
 
+@pytest.fixture
+def shop_user_client():
+    User = get_user_model()
+    user = User.objects.create_user(
+        'test_shop_123@test.ru', '123456789qwerty!!', type='shop')
+    token, _ = Token.objects.get_or_create(user_id=user.id)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    return client
+
+
+@pytest.fixture
+def price_list_path():
+    return str(settings.BASE_DIR / 'data' / 'shop1.yaml')
+
+
+@pytest.fixture
+def price_list_server(price_list_path, settings):
+    """ Локальный http сервер поставщика, отдающий прайс с ETag, /moved перенаправляет на localhost """
+    settings.PRICE_LIST_ALLOWED_HOSTS = ['127.0.0.1']
+    with open(price_list_path, 'rb') as f:
+        content = f.read()
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(dict(self.headers))
+            if self.path == '/moved':
+                self.send_response(302)
+                self.send_header('Location', f'http://localhost:{self.server.server_port}/shop1.yaml')
+                self.end_headers()
+                return
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_port}/shop1.yaml'
+    server.requests = requests
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
 @pytest.fixture
 def shop_factory():
     def factory(**kwargs):
@@ -55,6 +131,7 @@ def order_factory():
         return baker.make('Order', **kwargs)
     return factory
 
+
 @pytest.fixture
 def contact_factory():
     def factory(**kwargs):
@@ -1,6 +1,19 @@
+import csv
+import gzip
+import io
+import json
 import pytest
+from django.core.management import call_command
+from django.db.models import Count, Min
 from django.urls import reverse
-from backend.models import User
+from rest_framework.renderers import JSONRenderer
+from backend.models import Category, CategoryCounter, Order, OrderItem, Parameter, Product, ProductInfo, \
+    ProductListing, ProductParameter, Shop, User
+from backend.renderers import FastJSONRenderer
+from backend.rows import LISTING_FIELDS, listing_row, order_rows
+from backend.serializers import OrderSerializer, ProductInfoSerializer, ProductListingSerializer
+from backend.tasks import reconcile_catalog_counters
+from backend.views import ProductInfoViewSet
 
 
 @pytest.mark.django_db
@@ -66,7 +79,7 @@ def test_product(api_client, product_factory, category_factory, product_info_fac
     resp = api_client.get(url)
     resp_json = resp.json()
     assert resp.status_code == 200
-    assert len(resp_json) == 2
+    assert len(resp_json['results']) == 2
 
 
 @pytest.mark.django_db
@@ -91,3 +104,440 @@ def test_get_orders(simple_user_client, order_factory):
     resp = simple_user_client.get(url)
     assert resp.status_code == 200
     assert len(resp.data) == 2
+
+
+@pytest.mark.django_db
+def test_search_products(api_client, shop_user_client, price_list_path, django_capture_on_commit_callbacks):
+    """Тест полнотекстового поиска товаров"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    url = reverse('backend:ProductInfo-list')
+    resp = api_client.get(url, {'search': 'iphone xr'})
+    assert resp.status_code == 200
+    assert len(resp.json()['results']) == 3
+    resp = api_client.get(url, {'search': 'золот'})
+    names = [item['product']['name'] for item in resp.json()['results']]
+    assert names == ['Смартфон Apple iPhone XS Max 512GB (золотистый)']
+    resp = api_client.get(url, {'search': 'Смартфн'})
+    assert len(resp.json()['results']) == 4
+    resp = api_client.get(url, {'search': 'телевизор'})
+    assert resp.json()['results'] == []
+    # переименование товара и категории пересчитывает вектор поиска
+    product = Product.objects.get(name='Смартфон Apple iPhone XS Max 512GB (золотистый)')
+    product.name = 'Телевизор Samsung'
+    with django_capture_on_commit_callbacks(execute=True):
+        product.save()
+    resp = api_client.get(url, {'search': 'телевизор'})
+    assert [item['product']['name'] for item in resp.json()['results']] == ['Телевизор Samsung']
+    assert api_client.get(url, {'search': '512gb'}).json()['results'] == []
+    category = Category.objects.get(id=product.category_id)
+    category.name = 'Гаджеты'
+    with django_capture_on_commit_callbacks(execute=True):
+        category.save()
+    assert len(api_client.get(url, {'search': 'гаджет'}).json()['results']) == 4
+
+
+@pytest.mark.django_db
+def test_product_facets(api_client, shop_user_client, price_list_path, monkeypatch):
+    """Тест фильтров по параметрам товаров"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    # обновление остатков не пересчитывает значения фильтров
+    monkeypatch.setattr('backend.signals.refresh_facets', lambda shop_id: pytest.fail('refresh_facets'))
+    shop_user_client.post(
+        reverse('backend:partner-stock'), {'items': [{'external_id': 4216226, 'quantity': 0}]}, format='json'
+    )
+    diagonal = Parameter.objects.get(name='Диагональ (дюйм)')
+    color = Parameter.objects.get(name='Цвет')
+    resp = api_client.get(reverse('backend:ProductInfo-facets'), {'category_id': 224})
+    assert resp.status_code == 200
+    facets = {facet['name']: facet['values'] for facet in resp.json()}
+    assert facets['Диагональ (дюйм)'] == [{'value': '6.1', 'count': 3}, {'value': '6.5', 'count': 1}]
+    url = reverse('backend:ProductInfo-list')
+    resp = api_client.get(url, {f'param_{diagonal.id}': '6.1'})
+    assert len(resp.json()['results']) == 3
+    resp = api_client.get(url, {f'param_{diagonal.id}': '6.1', f'param_{color.id}': 'черный,золотистый'})
+    assert [item['model'] for item in resp.json()['results']] == ['apple/iphone/xr']
+    resp = api_client.get(reverse('backend:ProductInfo-facets'))
+    assert resp.status_code == 400
+    resp = api_client.get(reverse('backend:ProductInfo-facets'), {'category_id': 224, 'shop_id': 'abc'})
+    assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+def test_product_facets_follow_edits(api_client, shop_user_client, price_list_path):
+    """Тест: перенос товара в другую категорию и правка параметра через ORM обновляют значения фильтров"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    url = reverse('backend:ProductInfo-facets')
+
+    def diagonals(category_id):
+        facets = {facet['name']: facet['values'] for facet in api_client.get(url, {'category_id': category_id}).json()}
+        return facets.get('Диагональ (дюйм)', [])
+
+    product = ProductInfo.objects.get(external_id=4216292).product
+    product.category = Category.objects.create(id=100, name='Телефоны')
+    product.save()
+    assert diagonals(224) == [{'value': '6.1', 'count': 3}]
+    assert diagonals(100) == [{'value': '6.5', 'count': 1}]
+    parameter = ProductParameter.objects.filter(parameter__name='Диагональ (дюйм)', value='6.1').first()
+    parameter.value = '6.2'
+    parameter.save()
+    assert diagonals(224) == [{'value': '6.1', 'count': 2}, {'value': '6.2', 'count': 1}]
+    ProductInfo.objects.get(id=parameter.product_info_id).delete()
+    assert diagonals(224) == [{'value': '6.1', 'count': 2}]
+
+
+@pytest.mark.django_db
+def test_product_price_filters(api_client, shop_user_client, price_list_path):
+    """Тест фильтров по цене, наличию и сортировки товаров"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    shop_user_client.post(
+        reverse('backend:partner-stock'), {'items': [{'external_id': 4216226, 'quantity': 0}]}, format='json'
+    )
+    url = reverse('backend:ProductInfo-list')
+    resp = api_client.get(url, {'category_id': 224, 'ordering': '-price'})
+    assert [item['price'] for item in resp.json()['results']] == [110000, 65000, 65000, 60000]
+    resp = api_client.get(url, {'price_min': 60000, 'price_max': 65000, 'in_stock': 'true', 'ordering': 'price'})
+    assert [item['price'] for item in resp.json()['results']] == [60000, 65000]
+    resp = api_client.get(url, {'category_id': 224, 'ordering': 'name'})
+    assert resp.json()['results'][0]['product']['name'] == 'Смартфон Apple iPhone XR 128GB (синий)'
+    resp = api_client.get(url, {'price_min': 'дешево'})
+    assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+def test_product_pagination(api_client, shop_user_client, price_list_path):
+    """Тест постраничного вывода товаров по курсору"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    url = reverse('backend:ProductInfo-list')
+    prices = []
+    params = {'ordering': '-price', 'page_size': 1}
+    while url:
+        resp = api_client.get(url, params)
+        assert resp.status_code == 200
+        prices += [item['price'] for item in resp.json()['results']]
+        url, params = resp.json()['next'], None
+    assert prices == [110000, 65000, 65000, 60000]
+    url = reverse('backend:ProductInfo-list')
+    expected = [item['id'] for item in api_client.get(url, {'search': 'смартфон'}).json()['results']]
+    assert len(expected) > 2
+    ids = []
+    params = {'search': 'смартфон', 'page_size': 1}
+    while url and len(ids) <= len(expected):
+        resp = api_client.get(url, params)
+        ids += [item['id'] for item in resp.json()['results']]
+        url, params = resp.json()['next'], None
+    assert ids == expected
+    resp = api_client.get(reverse('backend:ProductInfo-list'), {'cursor': 'мусор'})
+    assert resp.status_code == 404
+
+
+@pytest.mark.django_db
+def test_catalog_cache(api_client, shop_user_client, price_list_path, django_capture_on_commit_callbacks,
+                       django_assert_num_queries):
+    """Тест кэша каталога: повторный запрос не обращается к БД, загрузка и смена статуса магазина сбрасывают кэш"""
+    url = reverse('backend:ProductInfo-list')
+    assert api_client.get(url).json()['results'] == []
+    with django_capture_on_commit_callbacks(execute=True):
+        shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    assert len(api_client.get(url, {'category_id': 224}).json()['results']) == 4
+    with django_assert_num_queries(0):
+        assert len(api_client.get(url, {'category_id': 224}).json()['results']) == 4
+    shop = Shop.objects.get()
+    shop.state = False
+    with django_capture_on_commit_callbacks(execute=True):
+        shop.save()
+    assert api_client.get(url, {'category_id': 224}).json()['results'] == []
+    assert api_client.get(reverse('backend:Shop-list')).json() == []
+    # ответы по магазину зависят и от изменений категорий
+    url = reverse('backend:Category-detail', args=[224])
+    assert api_client.get(url, {'shop_id': shop.id}).json()['name'] == 'Смартфоны'
+    category = Category.objects.get(id=224)
+    category.name = 'Телефоны'
+    with django_capture_on_commit_callbacks(execute=True):
+        category.save()
+    assert api_client.get(url, {'shop_id': shop.id}).json()['name'] == 'Телефоны'
+    # список магазинов не фильтруется по shop_id и зависит от всех магазинов
+    url = reverse('backend:Shop-list')
+    shop.state = True
+    with django_capture_on_commit_callbacks(execute=True):
+        shop.save()
+    assert len(api_client.get(url, {'shop_id': shop.id}).json()) == 1
+    with django_capture_on_commit_callbacks(execute=True):
+        Shop.objects.create(name='Второй магазин')
+    assert len(api_client.get(url, {'shop_id': shop.id}).json()) == 2
+
+
+@pytest.mark.django_db
+def test_etag_responses(api_client, simple_user_client, shop_factory, order_factory):
+    """Тест условных запросов с ETag для каталога и заказов"""
+    shop_factory(state=True)
+    url = reverse('backend:Shop-list')
+    resp = api_client.get(url)
+    etag = resp['ETag']
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 304
+    assert resp.content == b''
+    assert api_client.get(url, {'search': 'магазин'}, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    user = User.objects.get(email='test_user_123@test.ru')
+    order = order_factory(user_id=user.id, state='new')
+    url = reverse('backend:Order-list')
+    etag = simple_user_client.get(url)['ETag']
+    assert simple_user_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    order.state = 'confirmed'
+    order.save()
+    resp = simple_user_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == 200
+    assert resp.data[0]['state'] == 'confirmed'
+
+
+@pytest.mark.django_db
+def test_offer_fragments(api_client, shop_user_client, price_list_path, monkeypatch,
+                         django_capture_on_commit_callbacks):
+    """Тест сборки списка товаров из кэша JSON фрагментов"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    url = reverse('backend:ProductInfo-list')
+    resp = api_client.get(url)
+    data = ProductListingSerializer(ProductListing.objects.order_by('id'), many=True).data
+    assert resp.content == JSONRenderer().render({'next': None, 'results': data})
+
+    def fail(*args):
+        raise AssertionError('фрагмент должен браться из кэша')
+
+    monkeypatch.setattr(ProductInfoViewSet, 'fragment_row', staticmethod(fail))
+    assert len(api_client.get(url, {'ordering': 'price'}).json()['results']) == 4
+    monkeypatch.undo()
+    with django_capture_on_commit_callbacks(execute=True):
+        shop_user_client.post(
+            reverse('backend:partner-stock'), {'items': [{'external_id': 4216226, 'quantity': 0}]}, format='json'
+        )
+    offer = ProductInfo.objects.get(external_id=4216226)
+    results = api_client.get(url, {'ordering': 'price'}).json()['results']
+    assert [item['quantity'] for item in results if item['id'] == offer.id] == [0]
+
+
+@pytest.mark.django_db
+def test_fast_rows_match_serializers(shop_user_client, price_list_path, order_factory):
+    """Тест: быстрая сборка ответа побайтно совпадает с сериализаторами"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    renderer = JSONRenderer()
+    infos = ProductInfo.objects.select_related('product').prefetch_related('product_parameters__parameter')
+    expected = renderer.render(ProductInfoSerializer(infos.order_by('id'), many=True).data)
+    listing = ProductListing.objects.order_by('id').values(*LISTING_FIELDS)
+    assert renderer.render([listing_row(row) for row in listing]) == expected
+
+    user = User.objects.get(email='test_shop_123@test.ru')
+    for state in ('new', 'sent'):
+        order = order_factory(user_id=user.id, state=state)
+        for info in infos[:2]:
+            OrderItem.objects.create(order=order, product_info=info, quantity=2)
+    orders = Order.objects.filter(user_id=user.id)
+    expected = renderer.render(OrderSerializer(orders.prefetch_related('ordered_items'), many=True).data)
+    assert renderer.render(order_rows(orders)) == expected
+
+
+def test_benchmark_serializers():
+    """Тест запуска сравнения скорости сериализации"""
+    out = io.StringIO()
+    call_command('benchmark_serializers', rows=50, stdout=out)
+    assert 'OrderSerializer' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_fast_json(api_client, shop_user_client):
+    """Тест JSON ответов без экранирования кириллицы и разбора JSON тела запроса"""
+    resp = api_client.post(reverse('backend:user-register'), {'email': 'user@test.ru'}, format='json')
+    assert 'Не указаны все необходимые аргументы'.encode() in resp.content
+    resp = shop_user_client.post(reverse('backend:partner-stock'), '{"items": [', content_type='application/json')
+    assert resp.status_code == 400
+    data = {1: 'один', 'big': 2 ** 70, 'nested': [{None: True}]}
+    assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+    out = io.StringIO()
+    call_command('benchmark_renderers', rows=50, stdout=out)
+    assert 'заказы' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_streaming_lists(api_client, shop_user_client, price_list_path, order_factory):
+    """Тест потоковой выдачи списков товаров и заказов"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    resp = api_client.get(reverse('backend:ProductInfo-list'), {'stream': 'true'})
+    assert resp.streaming
+    results = api_client.get(reverse('backend:ProductInfo-list'), {'page_size': 500}).json()['results']
+    assert json.loads(b''.join(resp.streaming_content)) == results
+
+    user = User.objects.get(email='test_shop_123@test.ru')
+    order = order_factory(user_id=user.id, state='new')
+    for info in ProductInfo.objects.all()[:2]:
+        OrderItem.objects.create(order=order, product_info=info, quantity=2)
+    for name in ('backend:Order-list', 'backend:Partner-list'):
+        resp = shop_user_client.get(reverse(name), {'stream': '1'})
+        assert resp.streaming
+        assert json.loads(b''.join(resp.streaming_content)) == shop_user_client.get(reverse(name)).json()
+
+
+@pytest.mark.django_db
+def test_export_catalog(shop_user_client, price_list_path, tmp_path):
+    """Тест выгрузки каталога в NDJSON с gzip и в CSV с фильтром по категории"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    path = tmp_path / 'catalog.ndjson.gz'
+    call_command('export_catalog', str(path), gzip=True, stdout=io.StringIO())
+    with gzip.open(path) as stream:
+        rows = [json.loads(line) for line in stream]
+    assert [row['id'] for row in rows] == list(ProductInfo.objects.order_by('id').values_list('id', flat=True))
+    assert rows[0]['shop_name'] and rows[0]['category_name'] and rows[0]['parameters'][0]['parameter']
+
+    path = tmp_path / 'catalog.csv'
+    call_command('export_catalog', str(path), format='csv', category=224, stdout=io.StringIO())
+    with open(path, encoding='utf-8', newline='') as stream:
+        rows = list(csv.DictReader(stream))
+    assert len(rows) == ProductInfo.objects.filter(product__category_id=224).count()
+    assert {row['category_id'] for row in rows} == {'224'}
+    assert json.loads(rows[0]['parameters'])
+
+
+@pytest.mark.django_db
+def test_export_catalog_shop(shop_user_client, price_list_path, tmp_path, shop_factory, product_factory,
+                             product_info_factory):
+    """Тест выгрузки каталога одного магазина"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    shop = Shop.objects.get()
+    product_info_factory(shop=shop_factory(), product=product_factory(category=Category.objects.get(id=224)))
+    path = tmp_path / 'catalog.ndjson'
+    call_command('export_catalog', str(path), shop=shop.id, stdout=io.StringIO())
+    with open(path, 'rb') as stream:
+        rows = [json.loads(line) for line in stream]
+    assert [row['id'] for row in rows] == list(shop.product_infos.order_by('id').values_list('id', flat=True))
+    assert ProductListing.objects.exclude(shop_id=shop.id).exists()
+
+
+@pytest.mark.django_db
+def test_export_catalog_parquet(shop_user_client, price_list_path, tmp_path):
+    """Тест выгрузки каталога в Parquet: строки совпадают с NDJSON"""
+    parquet = pytest.importorskip('pyarrow.parquet')
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    call_command('export_catalog', str(tmp_path / 'catalog.ndjson'), stdout=io.StringIO())
+    with open(tmp_path / 'catalog.ndjson', 'rb') as stream:
+        expected = [json.loads(line) for line in stream]
+    for compress in (False, True):
+        path = tmp_path / 'catalog.parquet'
+        call_command('export_catalog', str(path), format='parquet', gzip=compress, stdout=io.StringIO())
+        assert parquet.read_table(path).to_pylist() == expected
+
+
+@pytest.mark.django_db
+def test_product_prices(api_client, shop_factory, product_factory, product_info_factory):
+    """Тест сравнения цен магазинов на товар"""
+    product, other = product_factory(), product_factory()
+    for price, quantity, state in ((300, 1, True), (100, 0, True), (200, 5, True), (250, 2, True), (50, 3, False)):
+        product_info_factory(product=product, shop=shop_factory(state=state), price=price, quantity=quantity)
+    product_info_factory(product=other, shop=shop_factory(state=True), price=10, quantity=1)
+    url = reverse('backend:ProductInfo-prices')
+    resp = api_client.get(url, {'product_id': f'{product.id},{other.id}', 'limit': 2})
+    assert resp.status_code == 200
+    best, cheapest = resp.json()
+    assert best['product'] == {'id': product.id, 'name': product.name}
+    assert (best['offers'], best['min_price'], best['avg_price'], best['max_price']) == (3, 200, 250, 300)
+    assert [offer['price'] for offer in best['best_offers']] == [200, 250]
+    assert [offer['price'] for offer in cheapest['best_offers']] == [10]
+    assert api_client.get(url, {'product_id': 'iphone'}).status_code == 400
+    assert api_client.get(url, {'product_id': product.id, 'limit': 0}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_suggest(api_client, shop_user_client, price_list_path, django_capture_on_commit_callbacks,
+                 django_assert_num_queries):
+    """Тест подсказок по началу слова: индекс в памяти перестраивается после загрузки прайса"""
+    url = reverse('backend:ProductInfo-suggest')
+    assert api_client.get(url, {'q': 'iph'}).json() == {'products': [], 'categories': []}
+    with django_capture_on_commit_callbacks(execute=True):
+        shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    resp = api_client.get(url, {'q': 'Смартфон apple IPH', 'limit': 2})
+    assert [product['name'] for product in resp.json()['products']] == [
+        'Смартфон Apple iPhone XR 128GB (синий)', 'Смартфон Apple iPhone XR 256GB (красный)'
+    ]
+    with django_assert_num_queries(0):
+        resp = api_client.get(url, {'q': 'смарт'})
+    assert [category['name'] for category in resp.json()['categories']] == ['Смартфоны']
+    assert len(resp.json()['products']) == 4
+    assert api_client.get(url, {'q': 'iph', 'limit': 100}).status_code == 400
+    # обновление остатков не перестраивает индекс, переименование товара - перестраивает
+    with django_capture_on_commit_callbacks(execute=True):
+        shop_user_client.post(
+            reverse('backend:partner-stock'), {'items': [{'external_id': 4216226, 'quantity': 0}]}, format='json'
+        )
+    with django_assert_num_queries(0):
+        api_client.get(url, {'q': 'смарт'})
+    product = ProductInfo.objects.get(external_id=4216226).product
+    product.name = 'Телефон Apple iPhone'
+    with django_capture_on_commit_callbacks(execute=True):
+        product.save()
+    assert [item['name'] for item in api_client.get(url, {'q': 'телеф'}).json()['products']] == [product.name]
+
+
+@pytest.mark.django_db
+def test_catalog_counters(api_client, shop_user_client, price_list_path):
+    """Тест счетчиков позиций категорий и магазинов: загрузка, остатки, статус магазина и сверка"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    category = api_client.get(reverse('backend:Category-detail', args=[224])).json()
+    assert (category['offer_count'], category['in_stock_count'], category['min_price']) == (4, 4, 60000)
+    shop = Shop.objects.get()
+    totals = ProductInfo.objects.aggregate(offers=Count('id'), price=Min('price'))
+    assert (shop.offer_count, shop.in_stock_count, shop.min_price) == (totals['offers'], totals['offers'],
+                                                                       totals['price'])
+    # пересчитываются только категории магазина: расхождение в чужой категории исправит только сверка
+    other = Category.objects.create(id=100, name='Телевизоры')
+    Category.objects.filter(id=other.id).update(offer_count=7)
+    shop_user_client.post(
+        reverse('backend:partner-stock'), {'items': [{'external_id': 4216226, 'quantity': 0}]}, format='json'
+    )
+    category = Category.objects.get(id=224)
+    assert (category.offer_count, category.in_stock_count, category.min_price) == (4, 3, 60000)
+    shop.state = False
+    shop.save()
+    category.refresh_from_db()
+    assert (category.offer_count, category.in_stock_count, category.min_price) == (0, 0, None)
+
+    shop.state = True
+    shop.save()
+    Category.objects.filter(id=224).update(offer_count=100)
+    CategoryCounter.objects.filter(shop=shop).delete()
+    assert Category.objects.get(id=other.id).offer_count == 7
+    reconcile_catalog_counters.delay()
+    category.refresh_from_db()
+    assert (category.offer_count, category.in_stock_count, category.min_price) == (4, 3, 60000)
+    assert Category.objects.get(id=other.id).offer_count == 0
+
+    # перенос товара в другую категорию через ORM меняет счетчики обеих категорий
+    product = ProductInfo.objects.get(external_id=4216226).product
+    product.category = other
+    product.save()
+    category.refresh_from_db()
+    assert (category.offer_count, category.in_stock_count) == (3, 3)
+    assert Category.objects.get(id=other.id).offer_count == 1
+    shop.delete()
+    category.refresh_from_db()
+    assert (category.offer_count, category.in_stock_count, category.min_price) == (0, 0, None)
+
+
+@pytest.mark.django_db
+def test_catalog_deletes(api_client, shop_user_client, price_list_path):
+    """Тест удаления позиции, товара и категории через ORM: витрина и счетчики обновляются сразу"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    url = reverse('backend:ProductInfo-list')
+    ProductInfo.objects.get(external_id=4216292).delete()
+    assert 'apple/iphone/xs-max' not in [item['model'] for item in api_client.get(url).json()['results']]
+    assert Category.objects.get(id=224).offer_count == 3
+    ProductInfo.objects.get(external_id=4216313).product.delete()
+    assert Category.objects.get(id=224).offer_count == 2
+    shop = Shop.objects.get()
+    assert shop.offer_count == ProductInfo.objects.count()
+    row = ProductListing.objects.values().first()
+    Category.objects.filter(id=224).delete()
+    assert not ProductListing.objects.filter(category_id=224).exists()
+    assert ProductListing.objects.count() == ProductInfo.objects.count()
+    shop.refresh_from_db()
+    assert shop.offer_count == ProductInfo.objects.count()
+    # строка витрины удаленной категории не ломает сверку
+    ProductListing.objects.create(**row)
+    reconcile_catalog_counters.delay()
+    assert not CategoryCounter.objects.filter(category_id=224).exists()
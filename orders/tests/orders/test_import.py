@@ -0,0 +1,461 @@
+import io
+import ipaddress
+import json
+import socket
+import threading
+import pytest
+from django.db import connection
+from django.urls import reverse
+from yaml import safe_load
+from backend.importer import PriceListImporter, make_importer
+from backend.models import User, Shop, Category, Product, ProductInfo, ProductListing, ProductParameter, ImportJob, \
+    OrderItem
+from backend.pricelist import Record, read_price_list
+from backend.serializers import ProductInfoSerializer, ProductListingSerializer
+from backend.tasks import start_imports
+
+
+def make_price_list(size):
+    goods = [{'id': index, 'category': 1, 'model': f'model-{index}', 'name': f'Товар {index}', 'price': 100,
+              'price_rrc': 120, 'quantity': 1, 'parameters': {'Цвет': 'черный', 'Вес': index}}
+             for index in range(size)]
+    return {'shop': 'Магазин', 'categories': [{'id': 1, 'name': 'Категория'}], 'goods': goods}
+
+
+def make_records(data):
+    yield Record('shop', data['shop'], 1)
+    for category in data['categories']:
+        yield Record('category', category, 1)
+    for item in data['goods']:
+        yield Record('item', item, 1)
+
+
+@pytest.mark.django_db
+def test_import_price_list(price_list_path):
+    """Тест пакетной загрузки прайса"""
+    user = User.objects.create_user('shop@test.ru', '123456789qwerty!!', type='shop')
+    with open(price_list_path, encoding='utf-8') as f:
+        data = safe_load(f)
+    with open(price_list_path, 'rb') as f:
+        statistics = PriceListImporter(user.id, batch_size=3).run(read_price_list(f))
+    shop = Shop.objects.get(user_id=user.id)
+    assert statistics['rows'] == len(data['goods'])
+    assert ProductInfo.objects.filter(shop_id=shop.id).count() == len(data['goods'])
+    assert Category.objects.filter(shops=shop.id).count() == len(data['categories'])
+    assert ProductParameter.objects.filter(product_info__shop_id=shop.id).count() == sum(
+        len(item['parameters']) for item in data['goods'])
+    parameter = ProductParameter.objects.get(
+        product_info__external_id=4216292, parameter__name='Диагональ (дюйм)')
+    assert parameter.value == '6.5'
+
+
+@pytest.mark.django_db
+def test_import_queries_do_not_grow_with_rows():
+    """Тест: число запросов не зависит от количества строк в пачке"""
+    user = User.objects.create_user('shop@test.ru', '123456789qwerty!!', type='shop')
+    data = make_price_list(500)
+    statistics = PriceListImporter(user.id).run(make_records(data))
+    assert statistics['rows'] == 500
+    assert statistics['queries'] < 30
+    assert ProductParameter.objects.count() == 1000
+
+
+@pytest.mark.django_db
+def test_reimport_price_list(shop_user_client, price_list_path):
+    """Тест повторной загрузки прайса через API"""
+    url = reverse('backend:Partner-list')
+    resp = shop_user_client.post(url, {'url': price_list_path})
+    assert resp.status_code == 202
+    assert resp.json()['Status'] == True
+    products = Product.objects.count()
+    resp = shop_user_client.post(url, {'url': price_list_path, 'mode': 'replace'})
+    job_url = reverse('backend:partner-import', args=[resp.json()['Task']])
+    resp = shop_user_client.get(job_url)
+    resp_json = resp.json()
+    assert resp.status_code == 200
+    assert resp_json['state'] == 'done'
+    assert resp_json['rows'] == ProductInfo.objects.count()
+    assert resp_json['statistics']['queries'] > 0
+    assert Product.objects.count() == products
+
+
+@pytest.mark.django_db
+def test_skip_unchanged_price_list(shop_user_client, price_list_path):
+    """Тест пропуска повторной загрузки того же файла"""
+    url = reverse('backend:Partner-list')
+    shop_user_client.post(url, {'url': price_list_path})
+    resp = shop_user_client.post(url, {'url': price_list_path})
+    job = ImportJob.objects.get(id=resp.json()['Task'])
+    assert job.state == 'done'
+    assert job.statistics['skipped'] == True
+    assert job.shop.price_hash
+
+
+@pytest.mark.django_db
+def test_import_job_failed(shop_user_client):
+    """Тест статуса загрузки с ошибкой"""
+    resp = shop_user_client.post(reverse('backend:Partner-list'), {'url': '/nonexistent/shop.yaml'})
+    assert resp.status_code == 202
+    job = ImportJob.objects.get(id=resp.json()['Task'])
+    assert job.state == 'failed'
+    assert job.errors
+
+
+def test_read_yaml_matches_safe_load(price_list_path):
+    """Тест потокового чтения YAML"""
+    with open(price_list_path, encoding='utf-8') as f:
+        data = safe_load(f)
+    with open(price_list_path, 'rb') as f:
+        records = list(read_price_list(f))
+    assert records[0] == Record('shop', data['shop'], 1)
+    assert [record.value for record in records if record.kind == 'category'] == data['categories']
+    items = [record for record in records if record.kind == 'item']
+    assert [record.value for record in items] == data['goods']
+    assert items[0].line == 11
+
+
+def test_read_jsonl_and_csv():
+    """Тест чтения прайса в форматах JSON lines и CSV"""
+    item = {'id': 7, 'category': 1, 'model': 'm', 'name': 'Товар', 'price': 10, 'price_rrc': 12, 'quantity': 3,
+            'parameters': {'Цвет': 'черный'}}
+    jsonl = '\n'.join([
+        json.dumps({'shop': 'Магазин', 'categories': [{'id': 1, 'name': 'Категория'}]}), json.dumps(item)
+    ]).encode()
+    csv = ('shop,category,category_name,id,model,name,price,price_rrc,quantity,Цвет\n'
+           'Магазин,1,Категория,7,m,Товар,10,12,3,черный\n').encode()
+    for stream, fmt in ((jsonl, 'jsonl'), (csv, 'csv')):
+        records = list(read_price_list(io.BytesIO(stream), fmt))
+        assert [record.kind for record in records] == ['shop', 'category', 'item']
+        assert records[2].value == item
+
+
+@pytest.mark.django_db
+def test_differential_import(price_list_path, order_factory):
+    """Тест загрузки только изменившихся позиций"""
+    user = User.objects.create_user('shop@test.ru', '123456789qwerty!!', type='shop')
+    with open(price_list_path, encoding='utf-8') as f:
+        data = safe_load(f)
+    PriceListImporter(user.id).run(make_records(data))
+    ids = dict(ProductInfo.objects.values_list('external_id', 'id'))
+    ordered, removed = data['goods'][2]['id'], data['goods'][3]['id']
+    returned = data['goods'][2]
+    OrderItem.objects.create(order=order_factory(user=user, state='new'), product_info_id=ids[ordered], quantity=1)
+    data['goods'][0]['price'] += 1000
+    data['goods'][1]['parameters']['Цвет'] = 'белый'
+    data['goods'][2:] = [dict(data['goods'][0], id=1, model='new')]
+    statistics = PriceListImporter(user.id).run(make_records(data))
+    assert {key: statistics[key] for key in ('inserted', 'updated', 'unchanged', 'removed')} == {
+        'inserted': 1, 'updated': 2, 'unchanged': 0, 'removed': 2
+    }
+    assert ProductInfo.objects.get(id=ids[data['goods'][0]['id']]).price == data['goods'][0]['price']
+    parameter = ProductParameter.objects.get(product_info_id=ids[data['goods'][1]['id']], parameter__name='Цвет')
+    assert parameter.value == 'белый'
+    assert ProductInfo.objects.get(id=ids[ordered]).quantity == 0
+    assert not ProductInfo.objects.filter(id=ids[removed]).exists()
+    statistics = PriceListImporter(user.id).run(make_records(data))
+    assert statistics['unchanged'] == 3
+    assert statistics['removed'] == 0
+    # снятая с продажи позиция вернулась в прайс с прежними данными
+    data['goods'].append(returned)
+    statistics = PriceListImporter(user.id).run(make_records(data))
+    assert statistics['updated'] == 1
+    assert ProductInfo.objects.get(id=ids[ordered]).quantity == returned['quantity']
+
+
+@pytest.mark.django_db
+def test_import_from_url(shop_user_client, price_list_server):
+    """Тест загрузки прайса по ссылке с условным запросом"""
+    url = reverse('backend:Partner-list')
+    resp = shop_user_client.post(url, {'url': price_list_server.url})
+    job = ImportJob.objects.get(id=resp.json()['Task'])
+    assert job.state == 'done'
+    assert job.rows == 4
+    assert job.shop.feed_etag == '"v1"'
+    # ETag запоминается вместе со ссылкой, ссылка магазина не меняется
+    assert (job.shop.feed_url, job.shop.url) == (price_list_server.url, None)
+    resp = shop_user_client.post(url, {'url': price_list_server.url})
+    job = ImportJob.objects.get(id=resp.json()['Task'])
+    assert job.statistics['skipped'] == True
+    assert price_list_server.requests[-1]['If-None-Match'] == '"v1"'
+
+
+@pytest.mark.django_db
+def test_import_from_url_size_limit(shop_user_client, price_list_server, monkeypatch):
+    """Тест ограничения размера прайса по ссылке"""
+    monkeypatch.setattr('backend.download.MAX_SIZE', 100)
+    resp = shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_server.url})
+    job = ImportJob.objects.get(id=resp.json()['Task'])
+    assert job.state == 'failed'
+    assert ProductInfo.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_import_from_url_forbidden_host(shop_user_client, price_list_server):
+    """Тест запрета загрузки прайса из внутренней сети, в том числе после перенаправления"""
+    url = reverse('backend:Partner-list')
+    resp = shop_user_client.post(url, {'url': 'http://10.0.0.1/shop1.yaml', 'dry_run': 'true'})
+    assert resp.json() == {'Status': False, 'Errors': 'Загрузка прайса с адреса 10.0.0.1 (10.0.0.1) запрещена'}
+    moved = price_list_server.url.replace('/shop1.yaml', '/moved')
+    resp = shop_user_client.post(url, {'url': moved, 'dry_run': 'true'})
+    assert resp.json()['Status'] == False
+    assert '(localhost) запрещена' in resp.json()['Errors']
+    assert len(price_list_server.requests) == 1
+    resp = shop_user_client.post(url, {'url': moved})
+    job = ImportJob.objects.get(id=resp.json()['Task'])
+    assert job.state == 'failed'
+    assert ProductInfo.objects.count() == 0
+    # локальные файлы - только из PRICE_LIST_DIRS
+    resp = shop_user_client.post(url, {'url': '/etc/passwd', 'dry_run': 'true'})
+    assert resp.json() == {'Status': False, 'Errors': 'Загрузка прайса из /etc/passwd запрещена'}
+
+
+@pytest.mark.django_db
+def test_import_from_url_pinned_address(shop_user_client, price_list_server, monkeypatch):
+    """Тест: соединение устанавливается с проверенным адресом, повторное разрешение имени не выполняется"""
+    # адрес локального сервера считается внешним, чтобы пройти проверку
+    monkeypatch.setattr(ipaddress.IPv4Address, 'is_global', property(lambda address: True))
+    getaddrinfo = socket.getaddrinfo
+    lookups = []
+
+    def resolve(host, *args, **kwargs):
+        if host != 'feed.test':
+            return getaddrinfo(host, *args, **kwargs)
+        # первый ответ проходит проверку, следующие вели бы в другое место
+        lookups.append(host)
+        if len(lookups) > 1:
+            raise socket.gaierror('повторное разрешение имени')
+        return getaddrinfo('127.0.0.1', *args, **kwargs)
+
+    monkeypatch.setattr(socket, 'getaddrinfo', resolve)
+    url = price_list_server.url.replace('127.0.0.1', 'feed.test')
+    resp = shop_user_client.post(reverse('backend:Partner-list'), {'url': url})
+    job = ImportJob.objects.get(id=resp.json()['Task'])
+    assert (job.state, job.rows) == ('done', 4)
+    assert price_list_server.requests[-1]['Host'] == url.split('/')[2]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_imports_of_one_shop():
+    """Тест: параллельные загрузки одного магазина выполняются по очереди"""
+    user = User.objects.create_user('shop@test.ru', '123456789qwerty!!', type='shop')
+    PriceListImporter(user.id).run(make_records(make_price_list(10)))
+    data = make_price_list(2000)
+    errors = []
+
+    def run_import():
+        try:
+            PriceListImporter(user.id).run(make_records(data))
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run_import) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert Shop.objects.count() == 1
+    assert ProductInfo.objects.count() == len(data['goods'])
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_imports_of_several_shops():
+    """Тест: параллельные загрузки разных магазинов с общими категориями не блокируют друг друга"""
+    users = [User.objects.create_user(f'shop{index}@test.ru', '123456789qwerty!!', type='shop') for index in range(4)]
+    categories = [{'id': category_id, 'name': f'Категория {category_id}'} for category_id in range(1, 201)]
+    errors = []
+
+    def run_import(index, user):
+        data = make_price_list(1000)
+        data.update(shop=f'Магазин {index}', categories=categories[::1 if index % 2 else -1])
+        for item in data['goods']:
+            item['category'] = categories[(item['id'] * (index + 1)) % len(categories)]['id']
+        try:
+            PriceListImporter(user.id).run(make_records(data))
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run_import, args=(index, user)) for index, user in enumerate(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert sum(Category.objects.values_list('offer_count', flat=True)) == 4000
+
+
+@pytest.mark.django_db
+def test_start_imports_for_several_shops(price_list_path):
+    """Тест запуска загрузок нескольких магазинов"""
+    jobs = [
+        ImportJob.objects.create(
+            user=User.objects.create_user(f'shop{index}@test.ru', '123456789qwerty!!', type='shop'),
+            url=price_list_path
+        ) for index in range(3)
+    ]
+    start_imports(jobs)
+    assert set(ImportJob.objects.values_list('state', flat=True)) == {'done'}
+    assert Shop.objects.count() == 3
+    assert ProductInfo.objects.count() == 12
+
+
+@pytest.mark.django_db
+def test_staging_import(price_list_path, order_factory):
+    """Тест загрузки через промежуточную таблицу"""
+    user = User.objects.create_user('shop@test.ru', '123456789qwerty!!', type='shop')
+    with open(price_list_path, encoding='utf-8') as f:
+        data = safe_load(f)
+    statistics = make_importer(user.id, 'staging').run(make_records(data))
+    assert statistics['inserted'] == len(data['goods'])
+    ids = dict(ProductInfo.objects.values_list('external_id', 'id'))
+    parameter = ProductParameter.objects.get(product_info_id=ids[4216292], parameter__name='Диагональ (дюйм)')
+    assert parameter.value == '6.5'
+    ordered, removed = data['goods'][2]['id'], data['goods'][3]['id']
+    returned = data['goods'][2]
+    OrderItem.objects.create(order=order_factory(user=user, state='new'), product_info_id=ids[ordered], quantity=1)
+    data['goods'][0]['price'] += 1000
+    data['goods'][1]['parameters']['Цвет'] = 'белый'
+    data['goods'][2:] = [dict(data['goods'][0], id=1, model='new')]
+    statistics = make_importer(user.id, 'staging').run(make_records(data))
+    assert {key: statistics[key] for key in ('inserted', 'updated', 'unchanged', 'removed')} == {
+        'inserted': 1, 'updated': 2, 'unchanged': 0, 'removed': 2
+    }
+    assert ProductInfo.objects.get(id=ids[data['goods'][0]['id']]).price == data['goods'][0]['price']
+    parameter = ProductParameter.objects.get(product_info_id=ids[data['goods'][1]['id']], parameter__name='Цвет')
+    assert parameter.value == 'белый'
+    assert ProductInfo.objects.get(id=ids[ordered]).quantity == 0
+    assert not ProductInfo.objects.filter(id=ids[removed]).exists()
+    assert ProductParameter.objects.filter(product_info__shop__user=user).count() == 16
+    data['goods'].append(returned)
+    statistics = make_importer(user.id, 'staging').run(make_records(data))
+    assert statistics['updated'] == 1
+    assert ProductInfo.objects.get(id=ids[ordered]).quantity == returned['quantity']
+
+
+@pytest.mark.django_db
+def test_staging_import_validation(price_list_path):
+    """Тест: при ошибках в прайсе каталог не изменяется"""
+    user = User.objects.create_user('shop@test.ru', '123456789qwerty!!', type='shop')
+    data = make_price_list(10)
+    make_importer(user.id, 'staging').run(make_records(data))
+    data['goods'][3]['id'] = data['goods'][2]['id']
+    data['goods'][5]['category'] = 999
+    del data['goods'][7]['price']
+    with pytest.raises(ValueError) as error:
+        make_importer(user.id, 'staging').run(make_records(data))
+    assert 'повторяется id 2' in str(error.value)
+    assert 'неизвестная категория 999' in str(error.value)
+    assert 'не заполнены обязательные поля' in str(error.value)
+    assert ProductInfo.objects.count() == 10
+
+
+@pytest.mark.django_db
+def test_dry_run(shop_user_client, price_list_path, tmp_path, settings):
+    """Тест проверки прайса без загрузки"""
+    settings.PRICE_LIST_DIRS = [*settings.PRICE_LIST_DIRS, tmp_path]
+    url = reverse('backend:Partner-list')
+    resp = shop_user_client.post(url, {'url': price_list_path, 'dry_run': 'true'})
+    resp_json = resp.json()
+    assert resp_json['Status'] == True
+    assert resp_json['Проверено позиций'] == 4
+    item = {'id': 1, 'category': 1, 'model': 'm', 'name': 'Товар', 'price': 10, 'price_rrc': 12, 'quantity': 3,
+            'parameters': {}}
+    lines = [
+        {'shop': 'Магазин', 'categories': [{'id': 1, 'name': 'Категория'}]},
+        item,
+        dict(item, id=2, price='10'),
+        dict(item, id=1),
+        dict(item, id=3, category=5),
+        {key: value for key, value in item.items() if key != 'quantity'},
+    ]
+    path = tmp_path / 'shop.jsonl'
+    path.write_text('\n'.join(json.dumps(line, ensure_ascii=False) for line in lines) + '\n{broken', encoding='utf-8')
+    resp = shop_user_client.post(url, {'url': str(path), 'dry_run': 'true'})
+    resp_json = resp.json()
+    assert resp_json['Status'] == False
+    assert [error['line'] for error in resp_json['Errors']] == [3, 4, 5, 6, 6, 7]
+    assert ImportJob.objects.count() == 0
+    assert ProductInfo.objects.count() == 0
+    # пустой YAML и ошибка разбора CSV - ошибки прайса, а не ошибка сервера
+    path = tmp_path / 'empty.yaml'
+    path.write_text('', encoding='utf-8')
+    resp = shop_user_client.post(url, {'url': str(path), 'dry_run': 'true'})
+    assert resp.status_code == 200 and resp.json()['Status'] == False
+    path = tmp_path / 'long.csv'
+    path.write_text('shop,id\n' + 'x' * 200000 + ',1\n', encoding='utf-8')
+    resp = shop_user_client.post(url, {'url': str(path), 'dry_run': 'true'})
+    assert resp.status_code == 200 and 2 in [error['line'] for error in resp.json()['Errors']]
+    # значения не того типа на месте объекта, id и ключей словаря
+    path = tmp_path / 'types.jsonl'
+    lines = [{'shop': 'Магазин', 'categories': [{'id': [1], 'name': 'Категория'}]}, 123, 'shop',
+             dict(item, id=[1]), dict(item, category=[1])]
+    path.write_text('\n'.join(json.dumps(line, ensure_ascii=False) for line in lines), encoding='utf-8')
+    resp = shop_user_client.post(url, {'url': str(path), 'dry_run': 'true'})
+    assert resp.status_code == 200
+    assert [error['line'] for error in resp.json()['Errors']] == [2, 3, 4, 4, 5]
+    path = tmp_path / 'key.yaml'
+    path.write_text('shop: Магазин\ngoods:\n  - {[1]: 2}\n', encoding='utf-8')
+    resp = shop_user_client.post(url, {'url': str(path), 'dry_run': 'true'})
+    assert resp.status_code == 200
+    assert resp.json()['Errors'] == [{'line': 3, 'error': 'ключ словаря должен быть строкой или числом'}]
+
+
+@pytest.mark.django_db
+def test_dry_run_size_limit(shop_user_client, price_list_server, monkeypatch):
+    """Тест ограничения размера прайса по ссылке при проверке без загрузки"""
+    monkeypatch.setattr('backend.views.DRY_RUN_MAX_SIZE', 100)
+    resp = shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_server.url, 'dry_run': 'true'})
+    assert resp.json()['Status'] == False
+    assert 'превышает 100 байт' in resp.json()['Errors']
+
+
+@pytest.mark.django_db
+def test_update_stock(shop_user_client, price_list_path, monkeypatch):
+    """Тест обновления цен и остатков поставщиком"""
+    shop_user_client.post(reverse('backend:Partner-list'), {'url': price_list_path})
+    # витрина обновляется только по измененным позициям, а не по всему магазину
+    monkeypatch.setattr('backend.signals.refresh_listing', lambda shop_id: pytest.fail('refresh_listing'))
+    url = reverse('backend:partner-stock')
+    items = [{'external_id': 4216292, 'quantity': 0}, {'external_id': 4216313, 'price': 60000, 'quantity': 3},
+             {'external_id': 1, 'quantity': 5}]
+    resp = shop_user_client.post(url, {'items': items}, format='json')
+    resp_json = resp.json()
+    assert resp_json['Status'] == True
+    assert resp_json['Обновлено позиций'] == 2
+    assert resp_json['Не найдено'] == [1]
+    product_info = ProductInfo.objects.get(external_id=4216292)
+    assert (product_info.quantity, product_info.price) == (0, 110000)
+    product_info = ProductInfo.objects.get(external_id=4216313)
+    assert (product_info.quantity, product_info.price) == (3, 60000)
+    assert ProductListing.objects.filter(id=product_info.id, quantity=3, price=60000).exists()
+    assert Shop.objects.get().price_hash == ''
+    resp = shop_user_client.post(url, {'items': [{'external_id': 4216292, 'price': -1}]}, format='json')
+    assert resp.json()['Status'] == False
+    # значение больше integer в БД - некорректная позиция, а не ошибка сервера
+    resp = shop_user_client.post(url, {'items': [{'external_id': 4216292, 'quantity': 2 ** 31}]}, format='json')
+    assert resp.json()['Status'] == False
+    assert resp.json()['Errors'].startswith('Некорректная позиция 0')
+
+
+@pytest.mark.django_db
+def test_listing_follows_import():
+    """Тест витрины: совпадает с ProductInfoSerializer и обновляется загрузкой прайса"""
+    user = User.objects.create_user('shop@test.ru', '123456789qwerty!!', type='shop')
+    data = make_price_list(5)
+    PriceListImporter(user.id).run(make_records(data))
+    infos = ProductInfo.objects.prefetch_related('product_parameters__parameter').select_related('product')
+    expected = ProductInfoSerializer(infos.order_by('id'), many=True).data
+    assert ProductListingSerializer(ProductListing.objects.order_by('id'), many=True).data == expected
+
+    data['goods'][0]['price'] = 90
+    del data['goods'][1]
+    PriceListImporter(user.id).run(make_records(data))
+    listing = ProductListing.objects.order_by('product_name')
+    assert [(row.product_name, row.price) for row in listing[:2]] == [('Товар 0', 90), ('Товар 2', 100)]
+    assert listing.count() == 4
+    Shop.objects.get(user_id=user.id).delete()
+    assert not ProductListing.objects.exists()